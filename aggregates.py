@@ -0,0 +1,367 @@
+# Server-side aggregations behind the dashboard charts
+#   python aggregates.py --check [--csv vehicles_us.csv] compares the correlation store with pandas
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+PRICE_BINS = 50
+
+
+def bin_edges(values, bins=PRICE_BINS):
+    """Fixed-width bin edges spanning ``values`` (NaNs ignored)."""
+    values = np.asarray(values, dtype='float64')
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return np.linspace(0.0, 1.0, bins + 1)
+    return np.histogram_bin_edges(values, bins=bins)
+
+
+def range_edges(low, high, bins=PRICE_BINS):
+    """Same edges as :func:`bin_edges` for data whose extremes are ``low`` and ``high`` (None = no data)."""
+    if low is None:
+        return np.linspace(0.0, 1.0, bins + 1)
+    return np.histogram_bin_edges(np.array([low, high], dtype='float64'), bins=bins)
+
+
+def histogram(values, edges):
+    """Counts of ``values`` per bin of ``edges`` (NaNs ignored)."""
+    values = np.asarray(values, dtype='float64')
+    counts, _ = np.histogram(values[~np.isnan(values)], bins=edges)
+    return counts
+
+
+def price_histogram(df):
+    """Price counts and bin edges of a frame (binned server-side, one bar per bin)."""
+    prices = df['price'].to_numpy(dtype='float64')
+    edges = bin_edges(prices)
+    return histogram(prices, edges), edges
+
+
+def histogram2d(x, y, bins=(60, 60)):
+    """2D counts over the rows where both ``x`` and ``y`` are known.
+
+    Returns ``(counts, x_edges, y_edges)`` with ``counts[i, j]`` the rows in
+    x bin ``i`` and y bin ``j``.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    known = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[known], y[known]
+    if x.size == 0:
+        return np.zeros(bins, dtype='int64'), np.linspace(0.0, 1.0, bins[0] + 1), np.linspace(0.0, 1.0, bins[1] + 1)
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    return counts.astype('int64'), x_edges, y_edges
+
+
+def price_density(df, x):
+    """2D counts of ``x`` against price for the density view of the scatters."""
+    return histogram2d(df[x].to_numpy(dtype='float64', na_value=np.nan), df['price'].to_numpy(dtype='float64'))
+
+
+# Outlier points kept per box (evenly spaced over the sorted outliers, extremes included)
+OUTLIER_SAMPLE = 50
+
+
+def _quantile(sorted_values, q):
+    """Linear-interpolated quantile of an ascending array (numpy/Plotly 'linear' method)."""
+    position = q * (sorted_values.size - 1)
+    low = int(np.floor(position))
+    high = min(low + 1, sorted_values.size - 1)
+    return float(sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low))
+
+
+def box_summary(sorted_values):
+    """Box-plot statistics of an ascending, NaN-free array."""
+    q1, median, q3 = (_quantile(sorted_values, q) for q in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    inside = sorted_values[(sorted_values >= q1 - 1.5 * iqr) & (sorted_values <= q3 + 1.5 * iqr)]
+    outliers = sorted_values[(sorted_values < q1 - 1.5 * iqr) | (sorted_values > q3 + 1.5 * iqr)]
+    if outliers.size > OUTLIER_SAMPLE:
+        outliers = outliers[np.linspace(0, outliers.size - 1, OUTLIER_SAMPLE).astype(int)]
+    return {
+        'count': int(sorted_values.size),
+        'min': float(sorted_values[0]),
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'max': float(sorted_values[-1]),
+        'lower_whisker': float(inside[0]),
+        'upper_whisker': float(inside[-1]),
+        'outliers': outliers.astype('float64'),
+    }
+
+
+def weighted_box_summary(values, counts):
+    """:func:`box_summary` of the data holding ``counts[i]`` copies of ``values[i]``.
+
+    ``values`` are distinct and ascending, so the summary of any number of
+    rows only needs their distinct values and how often each occurs.
+    """
+    values = np.asarray(values, dtype='float64')
+    counts = np.asarray(counts, dtype='int64')
+    ends = np.cumsum(counts)
+    total = int(ends[-1])
+
+    def nth(positions):
+        return values[np.searchsorted(ends, positions, side='right')]
+
+    def quantile(q):
+        position = q * (total - 1)
+        low = int(np.floor(position))
+        high = min(low + 1, total - 1)
+        value_low, value_high = nth([low, high])
+        return float(value_low + (value_high - value_low) * (position - low))
+
+    q1, median, q3 = (quantile(q) for q in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    inside = (values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)
+    outside = (values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)
+    outlier_values, outlier_counts = values[outside], counts[outside]
+    n_outliers = int(outlier_counts.sum())
+    if n_outliers > OUTLIER_SAMPLE:
+        picks = np.linspace(0, n_outliers - 1, OUTLIER_SAMPLE).astype(int)
+        outliers = outlier_values[np.searchsorted(np.cumsum(outlier_counts), picks, side='right')]
+    else:
+        outliers = np.repeat(outlier_values, outlier_counts)
+    return {
+        'count': total,
+        'min': float(values[0]),
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'max': float(values[-1]),
+        'lower_whisker': float(values[inside][0]),
+        'upper_whisker': float(values[inside][-1]),
+        'outliers': outliers,
+    }
+
+
+def group_box_summaries(keys, values):
+    """Box summaries of ``values`` per distinct key (rows with a missing key or value skipped)."""
+    codes, uniques = pd.factorize(keys, sort=True)
+    values = np.asarray(values, dtype='float64')
+    known = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[known], values[known]
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    bounds = np.searchsorted(codes, np.arange(len(uniques) + 1))
+    return {
+        key: box_summary(values[bounds[i]:bounds[i + 1]])
+        for i, key in enumerate(uniques.tolist())
+        if bounds[i + 1] > bounds[i]
+    }
+
+
+class BoxSummaryStore:
+    """Price box-plot statistics per make and per (make, model), computed once per frame.
+
+    Selections made of whole groups are answered from the stored summaries;
+    anything else (partial model selections, year ranges) is summarized from
+    the filtered rows only.
+    """
+
+    def __init__(self, df_vehicles):
+        prices = df_vehicles['price'].to_numpy(dtype='float64')
+        self.by_make = group_box_summaries(df_vehicles['make'], prices)
+        # Listings missing their make or model belong to no pair (as in filters.FilterIndex)
+        paired = (df_vehicles['make'].notna() & df_vehicles['model'].notna()).to_numpy()
+        pair_keys = pd.MultiIndex.from_arrays([df_vehicles['make'][paired], df_vehicles['model'][paired]])
+        self.by_make_model = group_box_summaries(pair_keys, prices[paired])
+        # A selection of all of a make's models leaves out the make's listings without a model
+        self.by_make_with_model = self.by_make if paired.all() else group_box_summaries(
+            df_vehicles['make'][paired], prices[paired])
+        self.models_by_make = {}
+        for make, model in self.by_make_model:
+            self.models_by_make.setdefault(make, set()).add(model)
+
+    def summaries(self, df_filtered, makes=(), models=(), year_filtered=False):
+        """Sorted ``[(make, summary)]`` for the selection that produced ``df_filtered``."""
+        if year_filtered:
+            return sorted(group_box_summaries(df_filtered['make'], df_filtered['price']).items())
+        if not models:
+            return [(make, self.by_make[make]) for make in sorted(makes or self.by_make) if make in self.by_make]
+
+        result = []
+        for make in sorted(self.models_by_make.keys() & set(makes or self.models_by_make)):
+            chosen = self.models_by_make[make] & set(models)
+            if not chosen:
+                continue
+            if chosen == self.models_by_make[make]:
+                result.append((make, self.by_make_with_model[make]))
+            elif len(chosen) == 1:
+                result.append((make, self.by_make_model[(make, chosen.pop())]))
+            else:
+                prices = df_filtered.loc[df_filtered['make'] == make, 'price'].to_numpy(dtype='float64')
+                result.append((make, box_summary(np.sort(prices[~np.isnan(prices)]))))
+        return result
+
+
+def pairwise_sums(values, shift):
+    """Pairwise-complete count and sums of a block of rows, for :func:`corr_from_sums`.
+
+    ``values`` is a (rows, columns) float array with NaN for missing values.
+    Returns ``(n, sum_x, sum_xx, sum_xy)``, each (columns, columns), over the
+    rows where both columns of a pair are known, with values shifted by
+    ``shift``. Sums of blocks with the same shift add up.
+    """
+    known = ~np.isnan(values)
+    shifted = np.where(known, values - shift, 0.0)
+    known = known.astype('float64')
+    sum_xy = shifted.T @ shifted
+    return known.T @ known, shifted.T @ known, (shifted ** 2).T @ known, sum_xy
+
+
+def corr_from_sums(n, sum_x, sum_xx, sum_xy):
+    """Pearson correlation matrix from pairwise-complete sums (NaN where undefined)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = n * sum_xy - sum_x * sum_x.T
+        variance = n * sum_xx - sum_x ** 2
+        corr = covariance / np.sqrt(variance * variance.T)
+    corr[(n < 2) | (variance <= 0) | (variance.T <= 0)] = np.nan
+    corr = np.clip(corr, -1.0, 1.0)
+    diagonal = np.diag_indices_from(corr)
+    corr[diagonal] = np.where(np.isnan(corr[diagonal]), np.nan, 1.0)
+    return corr
+
+
+class CorrelationStore:
+    """Pearson correlation of the numeric columns from per-group sufficient statistics.
+
+    Rows are grouped by (make, model, model_year). For every group and column
+    pair (i, j) the store keeps the pairwise-complete count and the sums of
+    x_i, x_i**2 and x_i*x_j over rows where both columns are known, so the
+    matrix of any make/model/year selection is a sum over its groups, matching
+    ``DataFrame.corr()`` (pairwise-complete Pearson) without rescanning rows.
+    Values are shifted by the column means first to keep the sums well
+    conditioned.
+    """
+
+    def __init__(self, df_vehicles):
+        numeric = df_vehicles.select_dtypes(include='number')
+        self.columns = list(numeric.columns)
+        values = np.column_stack([numeric[column].to_numpy(dtype='float64', na_value=np.nan)
+                                  for column in self.columns])
+        known = ~np.isnan(values)
+        self.shift = np.nanmean(values, axis=0)
+        shifted = np.where(known, values - self.shift, 0.0)
+        known = known.astype('float64')
+
+        key_codes = [pd.factorize(df_vehicles[column], sort=True) for column in ('make', 'model', 'model_year')]
+        combined = np.zeros(len(df_vehicles), dtype='int64')
+        for codes, uniques in key_codes:
+            combined = combined * (len(uniques) + 1) + codes + 1
+        group_keys, groups = np.unique(combined, return_inverse=True)
+        n_groups = len(group_keys)
+
+        # Decode each group's make, model and year labels (missing -> None/NaN)
+        labels = []
+        for codes, uniques in reversed(key_codes):
+            size = len(uniques) + 1
+            label_codes = group_keys % size - 1
+            group_keys = group_keys // size
+            names = np.array(list(uniques.tolist()) + [None], dtype=object)
+            labels.append(names[label_codes])
+        self.group_year = np.array([np.nan if year is None else year for year in labels[0]], dtype='float64')
+        self.group_model = labels[1]
+        self.group_make = labels[2]
+
+        k = len(self.columns)
+        self.n = np.zeros((n_groups, k, k))
+        self.sum_x = np.zeros((n_groups, k, k))
+        self.sum_xx = np.zeros((n_groups, k, k))
+        self.sum_xy = np.zeros((n_groups, k, k))
+        for i in range(k):
+            for j in range(k):
+                both = known[:, i] * known[:, j]
+                self.n[:, i, j] = np.bincount(groups, weights=both, minlength=n_groups)
+                self.sum_x[:, i, j] = np.bincount(groups, weights=shifted[:, i] * known[:, j], minlength=n_groups)
+                self.sum_xx[:, i, j] = np.bincount(groups, weights=shifted[:, i] ** 2 * known[:, j], minlength=n_groups)
+                if j >= i:
+                    self.sum_xy[:, i, j] = np.bincount(groups, weights=shifted[:, i] * shifted[:, j], minlength=n_groups)
+                    self.sum_xy[:, j, i] = self.sum_xy[:, i, j]
+
+    def group_mask(self, makes=(), models=(), year_range=None):
+        """Boolean mask of the groups inside a make/model/year selection (None range = any year)."""
+        mask = np.ones(len(self.group_make), dtype=bool)
+        if makes:
+            mask &= np.isin(self.group_make, list(makes))
+        if models:
+            mask &= np.isin(self.group_model, list(models))
+        if year_range is not None:
+            low, high = year_range
+            mask &= (self.group_year >= low) & (self.group_year <= high)
+        return mask
+
+    def corr(self, makes=(), models=(), year_range=None):
+        """Correlation matrix of the selection as a DataFrame, like ``DataFrame.corr()``."""
+        mask = self.group_mask(makes, models, year_range)
+        n = self.n[mask].sum(axis=0)
+        sum_x = self.sum_x[mask].sum(axis=0)
+        sum_xx = self.sum_xx[mask].sum(axis=0)
+        sum_xy = self.sum_xy[mask].sum(axis=0)
+        return pd.DataFrame(corr_from_sums(n, sum_x, sum_xx, sum_xy), index=self.columns, columns=self.columns)
+
+
+def correlation_parity(df_vehicles, selections=None):
+    """Compare :class:`CorrelationStore` with ``DataFrame.corr()`` on the selected rows; return the mismatches.
+
+    ``selections`` are ``(makes, models, year_range)`` tuples; by default all
+    rows, the most listed make, two of its models and a range of model years.
+    Missing values are kept, so the pairwise-complete counts are exercised.
+    """
+    store = CorrelationStore(df_vehicles)
+    if selections is None:
+        make = df_vehicles['make'].value_counts().index[0]
+        models = tuple(df_vehicles.loc[df_vehicles['make'] == make, 'model'].value_counts().index[:2])
+        low, high = int(df_vehicles['model_year'].min()), int(df_vehicles['model_year'].max())
+        middle = (low + high) // 2
+        selections = [((), (), None), ((make,), (), None), ((), models, None), ((), (), (middle, high)),
+                      ((make,), models, (low, middle))]
+    mismatches = []
+    for makes, models, year_range in selections:
+        mask = pd.Series(True, index=df_vehicles.index)
+        if makes:
+            mask &= df_vehicles['make'].isin(makes)
+        if models:
+            mask &= df_vehicles['model'].isin(models)
+        if year_range is not None:
+            mask &= df_vehicles['model_year'].between(*year_range).fillna(False).astype(bool)
+        expected = df_vehicles[mask].select_dtypes('number').corr()
+        actual = store.corr(makes, models, year_range)
+        try:
+            np.testing.assert_allclose(actual.loc[expected.index, expected.columns].to_numpy(), expected.to_numpy(),
+                                       rtol=1e-9, atol=1e-9, equal_nan=True)
+        except AssertionError as error:
+            mismatches.append(f'{(makes, models, year_range)}: {str(error).strip().splitlines()[0]}')
+    return mismatches
+
+
+def main(argv=None):
+    """Check the correlation store against pandas on the cleaned vehicles frame."""
+    import argparse
+
+    from vehicles_data import DATA_PATH, load_vehicles
+
+    parser = argparse.ArgumentParser(description='Check CorrelationStore against DataFrame.corr().')
+    parser.add_argument('--csv', default=DATA_PATH, help='source CSV (default: %(default)s)')
+    parser.add_argument('--check', action='store_true',
+                        help='compare the matrix of several selections with pandas; exit 1 on a mismatch')
+    args = parser.parse_args(argv)
+    if not args.check:
+        parser.print_help()
+        return 0
+
+    df_vehicles, _ = load_vehicles(args.csv, compact=True)
+    numeric = df_vehicles.select_dtypes('number')
+    print(f"columns with missing values: {', '.join(numeric.columns[numeric.isna().any()]) or 'none'}")
+    mismatches = correlation_parity(df_vehicles)
+    for mismatch in mismatches:
+        print(f'mismatch: {mismatch}')
+    print('parity: ok' if not mismatches else f'parity: {len(mismatches)} mismatches')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
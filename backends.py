@@ -0,0 +1,193 @@
+# Data backends behind the dashboards: a cleaned dataset in memory, the on-disk store or SQLite
+#   VEHICLES_BACKEND=memory (default), store or sqlite; VEHICLES_STORE=<store directory>; VEHICLES_DB=<database>
+import os
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+from compare import COMPARE_ATTRIBUTES, CarNameIndex, comparison_table
+from datasets import load_dataset
+from filters import FilterIndex
+from result_cache import results
+from table_view import page, sorted_positions
+from vehicles_data import cached_derived
+
+
+BACKEND = os.environ.get('VEHICLES_BACKEND', 'memory')
+STORE_PATH = os.environ.get('VEHICLES_STORE', 'vehicles_store')
+DB_PATH = os.environ.get('VEHICLES_DB', 'vehicles.sqlite')
+BACKENDS = ('memory', 'store', 'sqlite')
+
+
+class MemoryBackend:
+    """Selections over the cleaned frame held in memory, answered from its indexes.
+
+    Every backend offers the same API: ``key()`` turns sidebar choices into a
+    canonical selection, and the other methods take that selection.
+    """
+
+    kind = 'memory'
+
+    def __init__(self, df_vehicles):
+        self.df = df_vehicles
+        self.index = FilterIndex(df_vehicles)
+        self.names = CarNameIndex(df_vehicles)
+        self.boxes = aggregates.BoxSummaryStore(df_vehicles)
+        self.correlations = aggregates.CorrelationStore(df_vehicles)
+        self.token = self.index.token
+        self.n_rows = len(df_vehicles)
+        # In-memory bytes of the frame (shallow, as profiling.frame_metrics); None for the on-disk backends
+        self.nbytes = int(df_vehicles.memory_usage(index=True, deep=False).sum())
+        self.columns = list(df_vehicles.columns)
+        self.makes = self.index.makes
+        self.min_year, self.max_year = self.index.min_year, self.index.max_year
+        self.compare_attributes = [column for column in COMPARE_ATTRIBUTES if column in self.columns]
+
+    def models_for(self, makes):
+        return self.index.models_for(makes)
+
+    def key(self, makes=(), models=(), year_range=None):
+        return self.index.key(makes, models, year_range)
+
+    def positions(self, selection):
+        """Row positions of the selection (None = all rows), memoized across sessions."""
+        _, makes, models, year_range = selection
+        return results.get_or_compute((selection, 'positions'), lambda: self.index.positions(makes, models, year_range))
+
+    def count(self, selection):
+        positions = self.positions(selection)
+        return self.n_rows if positions is None else len(positions)
+
+    def frame(self, selection, columns=None):
+        """Rows of the selection; with ``columns``, only those columns are copied."""
+        positions = self.positions(selection)
+        if columns is None:
+            return FilterIndex.take(self.df, positions)
+        if positions is None:
+            return self.df[columns]
+        return self.df.iloc[positions, self.df.columns.get_indexer(columns)]
+
+    def page(self, selection, sort_by=None, ascending=True, page_number=1, page_size=25, columns=None):
+        ordered_positions = results.get_or_compute(
+            (selection, 'order', sort_by, ascending),
+            lambda: sorted_positions(self.df, self.positions(selection), sort_by, ascending))
+        return page(self.df, ordered_positions, page_number, page_size, columns)
+
+    def car_names(self, selection):
+        return self.names.names_in(self.positions(selection))
+
+    def comparison(self, selection, names):
+        return comparison_table(self.df, self.names, names, self.positions(selection), self.compare_attributes)
+
+    def conditions(self, selection):
+        return list(self.frame(selection, ['condition'])['condition'].dropna().unique())
+
+    def price_histogram(self, selection, condition=None):
+        df_selected = self.frame(selection, ['price'] if condition is None else ['price', 'condition'])
+        if condition is not None:
+            df_selected = df_selected[df_selected['condition'] == condition]
+        return aggregates.price_histogram(df_selected)
+
+    def price_density(self, selection, x):
+        return aggregates.price_density(self.frame(selection, [x, 'price']), x)
+
+    def box_summaries(self, selection):
+        _, makes, models, year_range = selection
+        return self.boxes.summaries(self.frame(selection, ['make', 'price']), makes, models,
+                                    year_filtered=year_range is not None)
+
+    def corr(self, selection):
+        _, makes, models, year_range = selection
+        return self.correlations.corr(makes, models, year_range)
+
+
+def open_backend(backend=BACKEND, compact=True, dataset='vehicles'):
+    """The configured backend of ``dataset`` (shared by every session) and a dict describing how it was loaded.
+
+    The store and sqlite backends serve the vehicles dataset only.
+    """
+    if backend == 'store' and dataset == 'vehicles':
+        from vehicles_store import open_store
+        return open_store(STORE_PATH)
+    if backend == 'sqlite' and dataset == 'vehicles':
+        from vehicles_db import open_database
+        return open_database(DB_PATH)
+    if backend not in BACKENDS:
+        raise ValueError(f'unknown VEHICLES_BACKEND {backend!r} (expected one of {", ".join(BACKENDS)})')
+    df_listings, load_info = load_dataset(dataset, compact)
+    return cached_derived(df_listings, MemoryBackend), load_info
+
+
+def default_selections(backend):
+    """Sidebar selections: all rows, every model, a year range, one make, all its models, make + models + years."""
+    # Whole-model selections leave out the listings without a model, unlike make-only ones
+    selections = [((), (), None), ((), backend.models_for(backend.makes), None)]
+    if backend.min_year is not None:
+        middle = (backend.min_year + backend.max_year) // 2
+        selections.append(((), (), (middle, backend.max_year)))
+    for make in backend.makes[:2]:
+        models = backend.models_for([make])[:2]
+        selections.append(([make], (), None))
+        selections.append(([make], backend.models_for([make]), None))
+        if backend.min_year is not None:
+            selections.append(([make], models, (backend.min_year, middle)))
+    return selections
+
+
+def parity_report(reference, candidate, selections=None, page_size=50):
+    """Compare every query of ``candidate`` with ``reference`` (e.g. MemoryBackend); return the mismatches.
+
+    Counts, names, conditions and pages must be identical; histograms, box
+    summaries and correlations must agree to floating-point tolerance.
+    """
+    mismatches = []
+
+    def check(label, same):
+        try:
+            ok = same()
+        except AssertionError as error:
+            ok = False
+            label = f'{label}: {str(error).strip().splitlines()[0]}'
+        if not ok:
+            mismatches.append(label)
+
+    def close(a, b):
+        return all(np.allclose(x, y, equal_nan=True) for x, y in zip(a, b))
+
+    def same_frame(a, b):
+        pd.testing.assert_frame_equal(a.astype(object), b.astype(object), check_dtype=False)
+        return True
+
+    columns = [column for column in ('price', 'make', 'model', 'odometer_miles', 'listing_date')
+               if column in reference.columns]
+    for makes, models, year_range in selections or default_selections(reference):
+        expected, actual = reference.key(makes, models, year_range), candidate.key(makes, models, year_range)
+        label = f'{list(makes)} {list(models)} {year_range}'
+        check(f'{label} count', lambda: reference.count(expected) == candidate.count(actual))
+        check(f'{label} car_names', lambda: reference.car_names(expected) == candidate.car_names(actual))
+        check(f'{label} conditions', lambda: reference.conditions(expected) == candidate.conditions(actual))
+        check(f'{label} price_histogram',
+              lambda: close(reference.price_histogram(expected), candidate.price_histogram(actual)))
+        for condition in reference.conditions(expected)[:1]:
+            check(f'{label} price_histogram[{condition}]',
+                  lambda: close(reference.price_histogram(expected, condition),
+                                candidate.price_histogram(actual, condition)))
+        for x in ('car_age', 'odometer_miles'):
+            check(f'{label} price_density[{x}]',
+                  lambda: close(reference.price_density(expected, x), candidate.price_density(actual, x)))
+        boxes, other_boxes = reference.box_summaries(expected), candidate.box_summaries(actual)
+        check(f'{label} box_summaries', lambda: [make for make, _ in boxes] == [make for make, _ in other_boxes] and all(
+            np.allclose(summary[field], other[field]) for (_, summary), (_, other) in zip(boxes, other_boxes)
+            for field in summary))
+        check(f'{label} corr', lambda: close([reference.corr(expected)], [candidate.corr(actual)]))
+        names = reference.car_names(expected)[:3]
+        if names:
+            check(f'{label} comparison',
+                  lambda: same_frame(reference.comparison(expected, names), candidate.comparison(actual, names)))
+        for sort_by, ascending, page_number in ((None, True, 1), (None, True, 3), ('price', False, 2),
+                                                ('odometer_miles', True, 1), ('make', True, 4)):
+            check(f'{label} page[{sort_by}, {ascending}, {page_number}]', lambda: same_frame(
+                reference.page(expected, sort_by, ascending, page_number, page_size, columns)[0],
+                candidate.page(actual, sort_by, ascending, page_number, page_size, columns)[0]))
+    return mismatches
@@ -0,0 +1,70 @@
+# Row-wise apply vs vectorized feature engineering
+#   python -m benchmarks.bench_features [--rows 1000000]
+import argparse
+import time
+
+import numpy as np
+
+import features
+from benchmarks.synthetic import make_raw_vehicles
+from vehicles_data import CATEGORY_COLUMNS
+
+
+def legacy_age_category(x):
+    if x < 5: return '<5'
+    elif x >= 5 and x < 10: return '5-10'
+    elif x >= 10 and x < 20: return '10-20'
+    else: return '>20'
+
+
+LEGACY = {
+    'high_mileage': lambda df: df['odometer_miles'].apply(lambda x: 1 if x > 150000 else 0),
+    'car_age': lambda df: df['model_year'].max() - df['model_year'],
+    'price_per_mile': lambda df: (df['price'] / df['odometer_miles']).replace([np.inf, -np.inf], np.nan),
+    'age_category': lambda df: df['car_age'].apply(legacy_age_category),
+    'car_display_name': lambda df: df[['make', 'model']].apply(lambda x: f"{x['make']} {x['model']}", axis=1),
+}
+
+VECTORIZED = {
+    'high_mileage': lambda df: features.high_mileage(df['odometer_miles']),
+    'car_age': lambda df: features.car_age(df['model_year']),
+    'price_per_mile': lambda df: features.price_per_mile(df['price'], df['odometer_miles']),
+    'age_category': lambda df: features.age_category(df['car_age']),
+    'car_display_name': lambda df: features.car_display_name(df['make'], df['model']),
+}
+
+
+def prepare(n_rows):
+    df = make_raw_vehicles(n_rows).astype({'model_year': 'Int64', 'odometer': 'Int64'})
+    df[['make', 'model']] = df['model'].str.split(' ', n=1, expand=True)
+    df = df.astype({column: 'category' for column in CATEGORY_COLUMNS})
+    df = df.rename(columns={'odometer': 'odometer_miles'})
+    df['car_age'] = features.car_age(df['model_year'])
+    return df
+
+
+def best_of(func, df, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare row-wise apply with the vectorized features.')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    df = prepare(args.rows)
+    print(f"{'feature':<18}{'apply (s)':>12}{'vectorized (s)':>16}{'speedup':>10}")
+    for name in VECTORIZED:
+        legacy = best_of(LEGACY[name], df, 1)
+        vectorized = best_of(VECTORIZED[name], df, args.repeat)
+        print(f"{name:<18}{legacy:>12.3f}{vectorized:>16.4f}{legacy / vectorized:>9.0f}x")
+
+
+if __name__ == '__main__':
+    main()
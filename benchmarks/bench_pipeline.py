@@ -0,0 +1,164 @@
+# Per-stage time and peak memory of the dashboard data pipeline on synthetic data
+#   python -m benchmarks.bench_pipeline [--rows 50000 1000000 10000000] [--out results.json]
+#   python -m benchmarks.bench_pipeline --compare before.json after.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+import plotly.graph_objects  # noqa: F401  (loaded up front so figure timings exclude the import)
+
+import aggregates
+import charts
+from benchmarks.synthetic import make_raw_vehicles
+from filters import FilterIndex
+from vehicles_data import clean_vehicles, compact_vehicles
+
+
+DEFAULT_ROWS = [50_000, 1_000_000, 10_000_000]
+
+# Representative sidebar selections: (makes, models, year range)
+SELECTIONS = {
+    'unfiltered': ((), (), None),
+    'one_make': (['ford'], (), None),
+    'makes_models_years': (['ford', 'toyota'], ['focus', 'camry'], (1995, 2010)),
+    'years_only': ((), (), (2005, 2012)),
+}
+
+
+def _measure(results, stage, func):
+    """Run ``func``, recording its wall time, or its peak traced memory while tracemalloc is on."""
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - start
+    if tracing:
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        results.setdefault(stage, {})['peak_mb'] = round(peak / 2**20, 2)
+    else:
+        results.setdefault(stage, {})['seconds'] = round(seconds, 6)
+    return value
+
+
+def run_pipeline(n_rows, seed=0, memory=True):
+    """Time every pipeline stage on ``n_rows`` synthetic listings.
+
+    Peak memory is measured in a second pass with tracemalloc on, because
+    tracing slows allocation-heavy stages down by several times.
+    """
+    stages = {}
+    raw = make_raw_vehicles(n_rows, seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'vehicles_us.csv')
+        raw.to_csv(csv_path, index=False)
+        del raw
+
+        _run_stages(stages, csv_path)
+        if memory:
+            tracemalloc.start()
+            try:
+                _run_stages(stages, csv_path)
+            finally:
+                tracemalloc.stop()
+    return stages
+
+
+def _run_stages(stages, csv_path):
+    """Load, clean, index, then filter/aggregate/plot each of SELECTIONS."""
+    raw = _measure(stages, 'load_csv', lambda: pd.read_csv(csv_path, low_memory=False))
+    df = _measure(stages, 'clean', lambda: clean_vehicles(raw))
+    del raw
+    df = _measure(stages, 'compact', lambda: compact_vehicles(df))
+    index = _measure(stages, 'build_filter_index', lambda: FilterIndex(df))
+    box_store = _measure(stages, 'build_box_summaries', lambda: aggregates.BoxSummaryStore(df))
+    corr_store = _measure(stages, 'build_correlation_stats', lambda: aggregates.CorrelationStore(df))
+
+    for name, (makes, models, years) in SELECTIONS.items():
+        year_range = index.key(makes, models, years)[3]
+        filtered = _measure(stages, f'filter[{name}]', lambda: index.filter(df, makes, models, years))
+        hist = _measure(stages, f'histogram[{name}]', lambda: aggregates.price_histogram(filtered))
+        density = _measure(stages, f'density[{name}]', lambda: aggregates.price_density(filtered, 'odometer_miles'))
+        boxes = _measure(stages, f'box_summaries[{name}]', lambda: box_store.summaries(
+            filtered, makes, models, year_filtered=year_range is not None))
+        corr = _measure(stages, f'correlation[{name}]', lambda: corr_store.corr(makes, models, year_range))
+        _measure(stages, f'figures[{name}]', lambda: [
+            charts.histogram_figure(*hist, title='price'),
+            charts.density_figure(*density, title='density', x_title='odometer_miles', y_title='price'),
+            charts.box_figure(boxes, title='box'),
+            charts.correlation_figure(corr),
+        ])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before_path, after_path):
+    """Print per-stage time ratios of two saved result files."""
+    with open(before_path) as handle:
+        before = json.load(handle)
+    with open(after_path) as handle:
+        after = json.load(handle)
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    for rows, stages in after['results'].items():
+        if rows not in before['results']:
+            continue
+        print(f'\n{rows} rows')
+        print(f"{'stage':<40}{'before (s)':>12}{'after (s)':>12}{'ratio':>8}")
+        for stage, measurement in stages.items():
+            old = before['results'][rows].get(stage)
+            if old is None:
+                continue
+            ratio = measurement['seconds'] / old['seconds'] if old['seconds'] else float('nan')
+            print(f"{stage:<40}{old['seconds']:>12.4f}{measurement['seconds']:>12.4f}{ratio:>7.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard data pipeline stages.')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass (time only)')
+    parser.add_argument('--out', default=None, help='write results as JSON (default: bench_<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    commit = _git_commit()
+    report = {
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'results': {},
+    }
+    for n_rows in args.rows:
+        stages = run_pipeline(n_rows, args.seed, memory=not args.no_memory)
+        report['results'][str(n_rows)] = stages
+        print(f'\n{n_rows} rows')
+        print(f"{'stage':<40}{'seconds':>10}{'peak MB':>10}")
+        for stage, measurement in stages.items():
+            peak = measurement.get('peak_mb')
+            print(f"{stage:<40}{measurement['seconds']:>10.4f}{'-' if peak is None else f'{peak:.1f}':>10}")
+
+    out = args.out or f"bench_{commit or 'local'}.json"
+    with open(out, 'w') as handle:
+        json.dump(report, handle, indent=2)
+    print(f'\nSaved {out}')
+
+
+if __name__ == '__main__':
+    main()
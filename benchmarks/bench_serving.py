@@ -0,0 +1,113 @@
+# Throughput and memory of serve.py as the number of workers grows
+#   python -m benchmarks.bench_serving [--workers 1 2 4] [--clients 8] [--reruns 20] [--out serving.json]
+# Each client is a dashboard session on its own websocket, asking for full reruns back to back.
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.session_client import DashboardSession
+from serve import RoundRobinProxy, process_memory, start_workers, stop_workers, wait_ready
+from vehicles_data import DATA_PATH, build_shared_snapshot, clear_cache
+
+
+PROXY_PORT = 8599
+
+
+async def run_session(url, reruns, latencies):
+    """Open one session and time ``reruns`` full script runs, from request to script_finished."""
+    session = await DashboardSession(url).connect()
+    try:
+        for _ in range(reruns):
+            latencies.append(await session.rerun())
+    finally:
+        session.close()
+
+
+async def run_clients(url, clients, reruns):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(url, reruns, latencies) for _ in range(clients)))
+    return latencies, time.perf_counter() - start
+
+
+def _start_proxy(ports, port):
+    """Run the round-robin proxy on an event loop thread of its own, as serve.py does in its process."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    server = asyncio.run_coroutine_threadsafe(RoundRobinProxy(ports).start('127.0.0.1', port), loop).result()
+    return loop, server
+
+
+def _stop_proxy(loop, server):
+    async def close():
+        server.close()
+        await server.wait_closed()
+    asyncio.run_coroutine_threadsafe(close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def bench_workers(app, n_workers, shared_path, clients, reruns):
+    """Throughput, latency and per-worker memory for ``n_workers`` workers under ``clients`` sessions."""
+    workers = start_workers(app, n_workers, shared_path=shared_path)
+    try:
+        wait_ready(workers)
+        loop, server = _start_proxy([port for port, _ in workers], PROXY_PORT)
+        try:
+            url = f'ws://127.0.0.1:{PROXY_PORT}/_stcore/stream'
+            # Warm every worker (load, indexes, first figures) before measuring
+            asyncio.run(run_clients(url, n_workers, 1))
+            latencies, seconds = asyncio.run(run_clients(url, clients, reruns))
+            memory = [process_memory(process.pid) for _, process in workers]
+        finally:
+            _stop_proxy(loop, server)
+    finally:
+        stop_workers(workers)
+
+    result = {
+        'workers': n_workers,
+        'clients': clients,
+        'reruns': len(latencies),
+        'reruns_per_s': round(len(latencies) / seconds, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 1),
+        'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 1),
+    }
+    if all(memory):
+        result['pss_mb_per_worker'] = round(sum(m['pss_mb'] for m in memory) / n_workers, 1)
+        result['private_mb_per_worker'] = round(sum(m['private_mb'] for m in memory) / n_workers, 1)
+        result['pss_mb_total'] = round(sum(m['pss_mb'] for m in memory), 1)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test serve.py with 1..N workers behind the proxy.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8, help='concurrent sessions')
+    parser.add_argument('--reruns', type=int, default=20, help='full reruns per session')
+    parser.add_argument('--app', default='my_app.py')
+    parser.add_argument('--csv', default=DATA_PATH)
+    parser.add_argument('--private', action='store_true',
+                        help='baseline: every worker loads its own copy instead of mapping the shared snapshot')
+    parser.add_argument('--out', default=None, help='write results as JSON')
+    args = parser.parse_args(argv)
+
+    shared_path = None
+    if not args.private:
+        shared_path = build_shared_snapshot(args.csv)
+        clear_cache()
+    results = [bench_workers(args.app, n, shared_path, args.clients, args.reruns) for n in args.workers]
+
+    columns = list(results[0])
+    print(' '.join(f'{column:>22}' for column in columns))
+    for result in results:
+        print(' '.join(f'{result.get(column, ""):>22}' for column in columns))
+    if args.out:
+        with open(args.out, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
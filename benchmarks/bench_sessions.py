@@ -0,0 +1,133 @@
+# Concurrent scripted users against one local instance of the dashboard
+#   python -m benchmarks.bench_sessions [--sessions 1 4 16] [--steps 20] [--think 0.5] [--out sessions.json]
+#   python -m benchmarks.bench_sessions --url ws://127.0.0.1:8501/_stcore/stream --pid <server pid>
+# Each session changes makes, models, the year slider, the compare toggle and the condition
+# selectbox at random (seeded), and every resulting rerun is timed from request to script_finished.
+import argparse
+import asyncio
+import json
+import random
+
+import numpy as np
+
+from benchmarks.session_client import DashboardSession
+from serve import process_memory, start_workers, stop_workers, wait_ready
+
+
+APP_PORT = 8598
+ACTIONS = ('makes', 'models', 'years', 'compare', 'condition')
+
+
+def choose_step(session, rng):
+    """Apply one random user action to ``session``; returns (action, fragment id to rerun)."""
+    widgets = session.widgets
+    for action in rng.sample(ACTIONS, len(ACTIONS)):
+        if action == 'makes':
+            options = widgets['Select Car Make'].options
+            return action, session.set('Select Car Make', rng.sample(options, rng.randint(0, min(3, len(options)))))
+        if action == 'models' and widgets.get('Select Car Model') and widgets['Select Car Model'].options:
+            options = widgets['Select Car Model'].options
+            return action, session.set('Select Car Model', rng.sample(options, rng.randint(1, min(2, len(options)))))
+        if action == 'years':
+            slider = widgets['Select Model Year:'].proto
+            low = rng.randint(int(slider.min), int(slider.max))
+            return action, session.set('Select Model Year:', (low, rng.randint(low, int(slider.max))))
+        if action == 'compare':
+            radio = widgets['Do you want to compare cars?']
+            current = session.states.get(radio.id)
+            answer = 'Yes' if current is None or current.int_value == 0 else 'No'
+            return action, session.set('Do you want to compare cars?', answer)
+        label = 'Select condition to view price distribution'
+        if action == 'condition' and widgets.get(label) and widgets[label].options:
+            return action, session.set(label, rng.choice(widgets[label].options))
+    return 'rerun', ''
+
+
+async def run_user(url, steps, seed, think, timings):
+    """One scripted user: the first page load, then ``steps`` interactions. Returns the open session."""
+    rng = random.Random(seed)
+    session = await DashboardSession(url).connect()
+    timings.append(('initial', await session.rerun()))
+    for _ in range(steps):
+        if think:
+            await asyncio.sleep(rng.expovariate(1 / think))
+        action, fragment_id = choose_step(session, rng)
+        timings.append((action, await session.rerun(fragment_id)))
+    return session
+
+
+async def run_load(url, n_sessions, steps, seed, think, pid):
+    """Run ``n_sessions`` users at once; memory is read while they are all still connected."""
+    before = process_memory(pid) if pid else None
+    timings = []
+    sessions = await asyncio.gather(*(run_user(url, steps, seed + i, think, timings) for i in range(n_sessions)))
+    after = process_memory(pid) if pid else None
+    errors = sum(len(session.exceptions) for session in sessions)
+    for session in sessions:
+        session.close()
+    return timings, errors, before, after
+
+
+def summarize(timings, n_sessions, errors, before, after):
+    interactions = np.array([seconds for action, seconds in timings if action != 'initial']) * 1000
+    initial = np.array([seconds for action, seconds in timings if action == 'initial']) * 1000
+    result = {
+        'sessions': n_sessions,
+        'reruns': len(interactions),
+        'errors': errors,
+        'initial_p50_ms': round(float(np.percentile(initial, 50)), 1),
+        'p50_ms': round(float(np.percentile(interactions, 50)), 1),
+        'p95_ms': round(float(np.percentile(interactions, 95)), 1),
+        'p99_ms': round(float(np.percentile(interactions, 99)), 1),
+        'over_1s_pct': round(float((interactions > 1000).mean() * 100), 1),
+    }
+    if before and after:
+        result['server_pss_mb'] = after['pss_mb']
+        result['mb_per_session'] = round((after['pss_mb'] - before['pss_mb']) / n_sessions, 2)
+    result['by_action_p95_ms'] = {
+        action: round(float(np.percentile([s * 1000 for a, s in timings if a == action], 95)), 1)
+        for action in sorted({action for action, _ in timings})
+    }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate concurrent dashboard users against one app instance.')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 4, 16], help='concurrency levels')
+    parser.add_argument('--steps', type=int, default=20, help='interactions per session')
+    parser.add_argument('--think', type=float, default=0.0, help='mean pause between interactions (s)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--app', default='my_app.py')
+    parser.add_argument('--url', default=None, help='websocket of an app already running (default: start one)')
+    parser.add_argument('--pid', type=int, default=None, help='its server process, for memory readings')
+    parser.add_argument('--out', default=None, help='write results as JSON')
+    args = parser.parse_args(argv)
+
+    workers = []
+    url, pid = args.url, args.pid
+    if url is None:
+        workers = start_workers(args.app, 1, APP_PORT)
+        url, pid = f'ws://127.0.0.1:{APP_PORT}/_stcore/stream', workers[0][1].pid
+    try:
+        if workers:
+            wait_ready(workers)
+        # One user first, so the data load and index builds are not charged to the measured sessions
+        asyncio.run(run_load(url, 1, len(ACTIONS), args.seed - 1, 0, None))
+        results = []
+        for n_sessions in args.sessions:
+            timings, errors, before, after = asyncio.run(run_load(url, n_sessions, args.steps, args.seed, args.think, pid))
+            results.append(summarize(timings, n_sessions, errors, before, after))
+    finally:
+        stop_workers(workers)
+
+    columns = [column for column in results[0] if column != 'by_action_p95_ms']
+    print(' '.join(f'{column:>15}' for column in columns))
+    for result in results:
+        print(' '.join(f'{result.get(column, ""):>15}' for column in columns))
+    if args.out:
+        with open(args.out, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
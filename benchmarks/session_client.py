@@ -0,0 +1,103 @@
+# A dashboard session driven over Streamlit's websocket protocol, the way a browser tab drives it
+import time
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+
+# Element types whose state the client can set, by their field name in the Element proto
+WIDGET_TYPES = ('multiselect', 'slider', 'radio', 'selectbox', 'number_input', 'checkbox')
+
+FINISHED = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY)
+
+
+class Widget:
+    """Last rendered version of a widget: its element type, id, proto and enclosing fragment."""
+
+    def __init__(self, kind, proto, fragment_id):
+        self.kind = kind
+        self.proto = proto
+        self.id = proto.id
+        self.label = proto.label
+        self.options = list(getattr(proto, 'options', ()))
+        self.fragment_id = fragment_id
+
+
+class DashboardSession:
+    """One headless session of a running app, e.g. ``ws://127.0.0.1:8501/_stcore/stream``.
+
+    :meth:`set` changes a widget by label like a user would, and :meth:`rerun`
+    sends every widget value set so far, then waits for the run to finish.
+    A widget inside a fragment reruns only that fragment, as in the browser.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.connection = None
+        self.widgets = {}
+        self.states = {}
+        self.exceptions = []
+
+    async def connect(self):
+        self.connection = await websocket_connect(self.url, subprotocols=['streamlit'])
+        return self
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def set(self, label, value):
+        """Set widget ``label`` to ``value`` (option values, not indexes); returns its fragment id."""
+        widget = self.widgets[label]
+        state = WidgetState(id=widget.id)
+        if widget.kind == 'multiselect':
+            state.int_array_value.data.extend(widget.options.index(option) for option in value)
+        elif widget.kind == 'slider':
+            state.double_array_value.data.extend(float(v) for v in (value if isinstance(value, tuple) else [value]))
+        elif widget.kind in ('radio', 'selectbox'):
+            state.int_value = widget.options.index(value)
+        elif widget.kind == 'number_input' and widget.proto.data_type == widget.proto.INT:
+            state.int_value = int(value)
+        elif widget.kind == 'number_input':
+            state.double_value = float(value)
+        else:
+            state.bool_value = bool(value)
+        self.states[widget.id] = state
+        return widget.fragment_id
+
+    async def rerun(self, fragment_id=''):
+        """Request a run (of one fragment if ``fragment_id``) and return its wall time in seconds."""
+        request = BackMsg()
+        request.rerun_script.query_string = ''
+        request.rerun_script.page_script_hash = ''
+        request.rerun_script.fragment_id = fragment_id
+        live_ids = {widget.id for widget in self.widgets.values()}
+        request.rerun_script.widget_states.widgets.extend(
+            state for widget_id, state in self.states.items() if widget_id in live_ids)
+
+        start = time.perf_counter()
+        await self.connection.write_message(request.SerializeToString(), binary=True)
+        while True:
+            payload = await self.connection.read_message()
+            if payload is None:
+                raise ConnectionError('session closed by the server')
+            message = ForwardMsg()
+            message.ParseFromString(payload)
+            kind = message.WhichOneof('type')
+            if kind == 'delta' and message.delta.WhichOneof('type') == 'new_element':
+                self._record(message.delta.new_element, message.delta.fragment_id)
+            elif kind == 'script_finished' and message.script_finished in FINISHED:
+                return time.perf_counter() - start
+            elif kind == 'script_finished' and message.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                raise RuntimeError('the app script failed to compile')
+
+    def _record(self, element, fragment_id):
+        kind = element.WhichOneof('type')
+        if kind == 'exception':
+            self.exceptions.append(element.exception.message)
+        elif kind in WIDGET_TYPES:
+            proto = getattr(element, kind)
+            self.widgets[proto.label] = Widget(kind, proto, fragment_id)
@@ -0,0 +1,35 @@
+# Synthetic vehicles_us.csv-shaped data for benchmarks
+import numpy as np
+import pandas as pd
+
+
+MODELS = [
+    'ford f-150', 'ford focus', 'ford escape', 'chevrolet silverado 1500', 'chevrolet malibu',
+    'toyota camry', 'toyota tacoma', 'honda civic', 'honda accord', 'nissan altima',
+    'jeep wrangler', 'jeep grand cherokee', 'ram 1500', 'gmc sierra', 'bmw x5',
+    'subaru outback', 'hyundai sonata', 'kia sorento', 'dodge charger', 'volkswagen jetta',
+]
+
+
+def make_raw_vehicles(n_rows, seed=0):
+    """Raw listings with the columns and missing-value pattern of vehicles_us.csv."""
+    rng = np.random.default_rng(seed)
+
+    def with_missing(values, fraction):
+        return np.where(rng.random(n_rows) < fraction, np.nan, values)
+
+    return pd.DataFrame({
+        'price': rng.integers(1, 60000, n_rows),
+        'model_year': with_missing(rng.integers(1960, 2020, n_rows), 0.07),
+        'model': rng.choice(MODELS, n_rows),
+        'condition': rng.choice(['excellent', 'good', 'fair', 'like new', 'new', 'salvage'], n_rows),
+        'cylinders': with_missing(rng.choice([4, 6, 8, 10], n_rows), 0.10),
+        'fuel': rng.choice(['gas', 'diesel', 'hybrid', 'electric', 'other'], n_rows),
+        'odometer': with_missing(rng.integers(0, 300000, n_rows), 0.15),
+        'transmission': rng.choice(['automatic', 'manual', 'other'], n_rows),
+        'type': rng.choice(['SUV', 'sedan', 'pickup', 'truck', 'coupe', 'wagon'], n_rows),
+        'paint_color': rng.choice(['white', 'black', 'silver', 'grey', 'red', None], n_rows),
+        'is_4wd': with_missing(np.ones(n_rows), 0.5),
+        'date_posted': (np.datetime64('2018-05-01') + rng.integers(0, 365, n_rows).astype('timedelta64[D]')).astype(str),
+        'days_listed': rng.integers(0, 200, n_rows),
+    })
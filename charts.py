@@ -0,0 +1,87 @@
+# Plotly figures built from pre-aggregated data
+# (plotly is imported inside each builder so it loads with the first panel, not at startup)
+import numpy as np
+
+
+# Plotly's default first trace color, shared by boxes and their outlier points
+BOX_COLOR = '#636efa'
+
+
+def histogram_figure(counts, edges, title, x_title='price', name=None):
+    """Bar chart of pre-binned counts that looks like a Plotly histogram."""
+    import plotly.graph_objects as go
+
+    edges = np.asarray(edges)
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        name=name,
+        showlegend=name is not None,
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate='%{customdata[0]:,.0f} - %{customdata[1]:,.0f}<br>count=%{y}<extra></extra>',
+    ))
+    fig.update_layout(title=title, bargap=0, xaxis_title=x_title, yaxis_title='count')
+    return fig
+
+
+def density_figure(counts, x_edges, y_edges, title, x_title, y_title):
+    """Heatmap of 2D bin counts; empty bins are left blank."""
+    import plotly.graph_objects as go
+
+    x_edges, y_edges = np.asarray(x_edges), np.asarray(y_edges)
+    z = np.where(counts > 0, counts, np.nan).T
+    fig = go.Figure(go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=z,
+        colorscale='Viridis',
+        colorbar=dict(title='listings'),
+        hovertemplate=f'{x_title}=%{{x:,.0f}}<br>{y_title}=%{{y:,.0f}}<br>listings=%{{z}}<extra></extra>',
+    ))
+    fig.update_layout(title=title, xaxis_title=x_title, yaxis_title=y_title)
+    return fig
+
+
+def box_figure(summaries, title, x_title='make', y_title='price'):
+    """Box plot drawn from ``[(label, box_summary)]`` with the sampled outliers as points."""
+    import plotly.graph_objects as go
+
+    labels = [label for label, _ in summaries]
+    fig = go.Figure(go.Box(
+        x=labels,
+        q1=[s['q1'] for _, s in summaries],
+        median=[s['median'] for _, s in summaries],
+        q3=[s['q3'] for _, s in summaries],
+        lowerfence=[s['lower_whisker'] for _, s in summaries],
+        upperfence=[s['upper_whisker'] for _, s in summaries],
+        name=y_title,
+        marker_color=BOX_COLOR,
+        showlegend=False,
+    ))
+    outlier_x = [label for label, s in summaries for _ in range(len(s['outliers']))]
+    outlier_y = np.concatenate([s['outliers'] for _, s in summaries]) if summaries else []
+    fig.add_trace(go.Scatter(x=outlier_x, y=outlier_y, mode='markers', name='outliers',
+                             marker=dict(size=4, color=BOX_COLOR), showlegend=False))
+    fig.update_layout(title=title, xaxis_title=x_title, yaxis_title=y_title)
+    return fig
+
+
+def correlation_figure(corr_matrix, title="Correlation Matrix for Numerical Features"):
+    """Annotated diverging heatmap of a correlation matrix (Plotly; no Matplotlib global state)."""
+    import plotly.graph_objects as go
+
+    values = corr_matrix.to_numpy(dtype='float64')
+    fig = go.Figure(go.Heatmap(
+        z=values,
+        x=list(corr_matrix.columns),
+        y=list(corr_matrix.index),
+        zmin=-1,
+        zmax=1,
+        colorscale='RdBu_r',
+        text=np.where(np.isnan(values), '', np.char.mod('%.2f', np.nan_to_num(values))),
+        texttemplate='%{text}',
+        hovertemplate='%{y} / %{x}: %{z:.3f}<extra></extra>',
+    ))
+    fig.update_layout(title=title, height=600, yaxis_autorange='reversed')
+    return fig
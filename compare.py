@@ -0,0 +1,50 @@
+# Car name index and the side-by-side comparison table
+import numpy as np
+import pandas as pd
+
+from features import car_display_name
+
+
+COMPARE_ATTRIBUTES = ['price', 'model_year', 'make', 'model', 'condition', 'cylinders', 'fuel',
+                      'odometer_miles', 'transmission', 'type', 'paint_color', 'is_4wd', 'listing_date', 'days_listed']
+
+
+class CarNameIndex:
+    """'make model' display name -> sorted row positions of its listings."""
+
+    def __init__(self, df_vehicles):
+        self.n_rows = len(df_vehicles)
+        codes, uniques = pd.factorize(car_display_name(df_vehicles['make'], df_vehicles['model']), sort=True)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        self.rows = {name: order[bounds[i]:bounds[i + 1]] for i, name in enumerate(uniques.tolist())}
+        self.names = list(self.rows)
+
+    def names_in(self, positions):
+        """Deduplicated, sorted names having at least one listing among ``positions`` (None = all)."""
+        if positions is None:
+            return self.names
+        selected = np.zeros(self.n_rows, dtype=bool)
+        selected[positions] = True
+        return [name for name, rows in self.rows.items() if selected[rows].any()]
+
+    def first_row(self, name, positions=None):
+        """Position of the first listing called ``name`` (restricted to ``positions`` if given)."""
+        rows = self.rows[name]
+        if positions is not None:
+            rows = np.intersect1d(rows, positions, assume_unique=True)
+        return int(rows[0])
+
+
+def comparison_table(df_vehicles, name_index, names, positions=None, attributes=COMPARE_ATTRIBUTES):
+    """Attribute-by-car table comparing the first listing of each name."""
+    listings = df_vehicles.iloc[[name_index.first_row(name, positions) for name in names]]
+    return listing_table(listings, names, attributes)
+
+
+def listing_table(listings, names, attributes=COMPARE_ATTRIBUTES):
+    """Attribute-by-car table of one listing row per name (rows in the order of ``names``)."""
+    table = {'Attribute': attributes}
+    for name, (_, row) in zip(names, listings.iterrows()):
+        table[name] = row[attributes].values
+    return pd.DataFrame(table)
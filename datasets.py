@@ -0,0 +1,91 @@
+# Schema-mapped loading of the listing datasets behind the dashboards
+#   vehicles: vehicles_us.csv (my_app.py); workshop: cars_workshop.csv (myapp.py)
+import os
+
+import pandas as pd
+
+from features import add_vehicle_features
+from vehicles_data import cached_frame, file_fingerprint, load_vehicles, memory_report
+
+
+KM_TO_MILES = 0.621371
+
+
+class Dataset:
+    """How one listings file maps onto the shared schema.
+
+    Every dataset is loaded into the column names of the vehicles dashboard
+    (make, model, model_year, price, odometer_miles, condition, fuel, type,
+    paint_color, transmission) plus the derived columns of
+    :func:`features.add_vehicle_features`, so filters, aggregates and the
+    memory backend work the same on all of them. Columns without a
+    counterpart keep their own names.
+    """
+
+    def __init__(self, name, path, rename=None, odometer_km=None, category_columns=(), reference_year=None,
+                 read_options=None):
+        self.name = name
+        self.path = path
+        self.rename = rename or {}
+        self.odometer_km = odometer_km
+        self.category_columns = list(category_columns)
+        self.reference_year = reference_year
+        self.read_options = read_options or {}
+
+    def clean(self, df_raw):
+        """Rename a raw frame to the shared schema, type it and add the derived columns."""
+        df_listings = df_raw.rename(columns=self.rename)
+        if self.odometer_km is not None:
+            df_listings['odometer_miles'] = (df_listings[self.odometer_km] * KM_TO_MILES).round().astype('Int64')
+        df_listings['model_year'] = df_listings['model_year'].astype('Int64')
+        return add_vehicle_features(df_listings, self.reference_year)
+
+    def load(self, compact=True):
+        """The cleaned frame, cached per process until the file changes, and how it was obtained.
+
+        ``compact`` stores ``category_columns`` as categoricals and reports the
+        memory saved, like the compact schema of :func:`vehicles_data.load_vehicles`.
+        """
+        def build():
+            df_listings = self.clean(pd.read_csv(self.path, **self.read_options))
+            if not compact:
+                return df_listings, 'csv', None
+            df_compact = df_listings.astype({column: 'category' for column in self.category_columns})
+            return df_compact, 'csv', memory_report(df_listings, df_compact)
+        return cached_frame((os.path.abspath(self.path), self.name, compact), file_fingerprint(self.path), build)
+
+
+class VehiclesDataset(Dataset):
+    """vehicles_us.csv, already in the shared schema, loaded through its columnar snapshot."""
+
+    def load(self, compact=True):
+        return load_vehicles(self.path, compact=compact)
+
+
+DATASETS = {
+    'vehicles': VehiclesDataset('vehicles', 'vehicles_us.csv'),
+    'workshop': Dataset(
+        'workshop', 'cars_workshop.csv',
+        rename={
+            'manufacturer_name': 'make',
+            'model_name': 'model',
+            'year_produced': 'model_year',
+            'price_usd': 'price',
+            'state': 'condition',
+            'engine_type': 'fuel',
+            'body_type': 'type',
+            'color': 'paint_color',
+        },
+        odometer_km='odometer_value',
+        category_columns=['make', 'model', 'condition', 'fuel', 'type', 'paint_color', 'transmission'],
+        reference_year=2024,
+        read_options={'index_col': 0},
+    ),
+}
+
+
+def load_dataset(name, compact=True):
+    """Cleaned, shared-schema frame of dataset ``name`` and a dict describing how it was loaded."""
+    if name not in DATASETS:
+        raise ValueError(f'unknown dataset {name!r} (expected one of {", ".join(DATASETS)})')
+    return DATASETS[name].load(compact)
@@ -0,0 +1,64 @@
+# Vectorized derived columns shared by the dashboards
+import numpy as np
+import pandas as pd
+
+
+HIGH_MILEAGE_MILES = 150000
+
+AGE_BINS = [0, 5, 10, 20, float('inf')]
+AGE_LABELS = ['<5', '5-10', '10-20', '>20']
+
+
+def car_age(model_year, reference_year=None):
+    """Age in years relative to ``reference_year`` (defaults to the newest model year)."""
+    if reference_year is None:
+        reference_year = model_year.max()
+    return reference_year - model_year
+
+
+def price_per_mile(price, odometer):
+    """Price divided by mileage; zero, negative or missing mileage gives NaN instead of inf."""
+    index = price.index
+    price = price.to_numpy(dtype='float64', na_value=np.nan)
+    odometer = odometer.to_numpy(dtype='float64', na_value=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(odometer > 0, price / odometer, np.nan)
+    return pd.Series(ratio, index=index)
+
+
+def high_mileage(odometer, threshold=HIGH_MILEAGE_MILES):
+    """1 for listings above ``threshold`` miles, 0 otherwise (including unknown mileage)."""
+    return odometer.gt(threshold).fillna(False).astype('int64')
+
+
+def age_category(age):
+    """Bucket ages into '<5', '5-10', '10-20' and '>20' (lower bound inclusive)."""
+    return pd.cut(age, bins=AGE_BINS, labels=AGE_LABELS, right=False)
+
+
+def car_display_name(make, model):
+    """'make model' label per row.
+
+    Categorical inputs are combined per distinct (make, model) code pair, so the
+    string work is proportional to the number of distinct cars, not listings.
+    """
+    if isinstance(make.dtype, pd.CategoricalDtype) and isinstance(model.dtype, pd.CategoricalDtype):
+        # Shift codes by one so missing values (code -1) map to a leading 'nan' name
+        make_names = np.append('nan', make.cat.categories.astype(str)).astype(str)
+        model_names = np.append('nan', model.cat.categories.astype(str)).astype(str)
+        pair_codes = (make.cat.codes.to_numpy(dtype='int64') + 1) * len(model_names) \
+            + model.cat.codes.to_numpy(dtype='int64') + 1
+        unique_pairs, inverse = np.unique(pair_codes, return_inverse=True)
+        names = np.char.add(np.char.add(make_names[unique_pairs // len(model_names)], ' '),
+                            model_names[unique_pairs % len(model_names)])
+        return pd.Series(names[inverse], index=make.index, dtype=object)
+    return make.astype(str).str.cat(model.astype(str), sep=' ')
+
+
+def add_vehicle_features(df_vehicles, reference_year=None):
+    """Add car_age, price_per_mile, high_mileage and age_category to a vehicles frame."""
+    df_vehicles['car_age'] = car_age(df_vehicles['model_year'], reference_year)
+    df_vehicles['price_per_mile'] = price_per_mile(df_vehicles['price'], df_vehicles['odometer_miles'])
+    df_vehicles['high_mileage'] = high_mileage(df_vehicles['odometer_miles'])
+    df_vehicles['age_category'] = age_category(df_vehicles['car_age'])
+    return df_vehicles
@@ -0,0 +1,116 @@
+# Index-backed make/model/year filtering of the vehicles frame
+import itertools
+
+import numpy as np
+import pandas as pd
+
+
+def _group_positions(values):
+    """Map each distinct value to the sorted row positions holding it (missing values skipped)."""
+    codes, uniques = pd.factorize(values, sort=True)
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    bounds = np.concatenate([[0], np.cumsum(counts)]) + np.count_nonzero(codes < 0)
+    return {
+        value.item() if hasattr(value, 'item') else value: order[bounds[i]:bounds[i + 1]]
+        for i, value in enumerate(uniques)
+    }
+
+
+def _union(arrays):
+    """Sorted union of disjoint sorted position arrays."""
+    if not arrays:
+        return np.empty(0, dtype=np.intp)
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.sort(np.concatenate(arrays))
+
+
+# Distinguishes indexes of different frames in shared cache keys
+_tokens = itertools.count()
+
+
+def models_offered(models_by_make, makes):
+    """Sorted models offered by any of ``makes``, from a make -> models mapping."""
+    return sorted({model for make in makes for model in models_by_make.get(make, ())})
+
+
+def selection_key(token, makes=(), models=(), year_range=None, min_year=None, max_year=None):
+    """Canonical, hashable form of a selection of the data identified by ``token``, for use as a cache key.
+
+    Selection order does not matter and a year range covering every model
+    year (``min_year``..``max_year``) is the same as no year filter. Every
+    backend builds its keys here, so equal sidebar states share cache entries.
+    """
+    if year_range is not None and min_year is not None:
+        low, high = year_range
+        year_range = None if low <= min_year and high >= max_year else (int(low), int(high))
+    return (token, tuple(sorted(makes)), tuple(sorted(models)), year_range)
+
+
+class FilterIndex:
+    """Inverted indexes (value -> sorted row positions) for make, model and model_year.
+
+    Built once per frame; answers filter combinations by intersecting position
+    arrays instead of evaluating boolean masks over the whole table.
+    """
+
+    def __init__(self, df_vehicles):
+        self.token = next(_tokens)
+        self.n_rows = len(df_vehicles)
+        self.by_make = _group_positions(df_vehicles['make'])
+        self.by_model = _group_positions(df_vehicles['model'])
+        self.by_year = _group_positions(df_vehicles['model_year'])
+        self.years = df_vehicles['model_year'].to_numpy(dtype='float64', na_value=np.nan)
+        self.min_year = min(self.by_year) if self.by_year else None
+        self.max_year = max(self.by_year) if self.by_year else None
+        self.makes = sorted(self.by_make)
+
+        # Models available for each make, for the dependent model multiselect
+        pairs = df_vehicles[['make', 'model']].dropna().drop_duplicates()
+        self.models_by_make = {
+            make: sorted(models) for make, models in pairs.groupby('make', observed=True)['model'].apply(set).items()
+        }
+
+    def models_for(self, makes):
+        """Sorted models offered by any of ``makes``."""
+        return models_offered(self.models_by_make, makes)
+
+    def key(self, makes=(), models=(), year_range=None):
+        """Canonical, hashable form of a selection, for use as a cache key (see :func:`selection_key`)."""
+        return selection_key(self.token, makes, models, year_range, self.min_year, self.max_year)
+
+    def positions(self, makes=(), models=(), year_range=None):
+        """Sorted row positions matching the selection, or None when nothing is filtered.
+
+        Empty ``makes``/``models`` mean "any". A ``year_range`` covering every
+        model year is treated as unfiltered (listings without a year are kept);
+        a narrower range keeps only listings with a year inside it.
+        """
+        candidate = None
+        if makes:
+            candidate = _union([self.by_make[make] for make in makes if make in self.by_make])
+        if models:
+            model_rows = _union([self.by_model[model] for model in models if model in self.by_model])
+            candidate = model_rows if candidate is None else np.intersect1d(candidate, model_rows, assume_unique=True)
+
+        if year_range is not None and self.min_year is not None:
+            low, high = year_range
+            if low > self.min_year or high < self.max_year:
+                if candidate is None:
+                    candidate = _union([rows for year, rows in self.by_year.items() if low <= year <= high])
+                else:
+                    years = self.years[candidate]
+                    candidate = candidate[(years >= low) & (years <= high)]
+        return candidate
+
+    def filter(self, df_vehicles, makes=(), models=(), year_range=None):
+        """Rows of ``df_vehicles`` (the indexed frame) matching the selection."""
+        return self.take(df_vehicles, self.positions(makes, models, year_range))
+
+    @staticmethod
+    def take(df_vehicles, positions):
+        """Rows at ``positions`` as returned by :meth:`positions` (None means all rows)."""
+        if positions is None:
+            return df_vehicles
+        return df_vehicles.iloc[positions]
@@ -1,22 +1,29 @@
 # Standard libraries
-import numpy as np  
 import pandas as pd  
-import matplotlib.pyplot as plt  
-import seaborn as sns  
 import streamlit as st
-import plotly.express as px
+import os
 import warnings
 
+from backends import open_backend
+from charts import box_figure, correlation_figure, density_figure, histogram_figure
+import profiling
+import warmup
+from panels import (build_figures, cached_figure, completion_order, figure_stage, panel, start_interaction,
+                    timings_table)
+from result_cache import content_key, results
+from table_view import PAGE_SIZES, page_count
+
 
 
 warnings.filterwarnings(action='ignore')
   
 # Config
 pd.set_option('display.max_columns', None) 
-sns.set_style('darkgrid') 
 
 # Streamlit Config
 st.set_page_config(page_title="Used Cars Market", layout="wide")
+start_interaction()
+profiler = profiling.start_rerun()
 
 # Title and Subtitle
 st.markdown("""
@@ -24,32 +31,20 @@ st.markdown("""
     <h3 style='text-align: center;'>🛠️ Filter cars and Explore Market trends 🏁</h3>
 """, unsafe_allow_html=True)
 
-# Load dataset
-df_vehicles = pd.read_csv('vehicles_us.csv',low_memory= False)
-
-# Convert data types
-df_vehicles = df_vehicles.astype({
-    'model_year': 'Int64', 
-    'cylinders': 'Int64', 
-    'odometer': 'Int64'})
-df_vehicles['is_4wd'] = df_vehicles['is_4wd'].fillna(0).astype(bool)   
-df_vehicles['date_posted'] = pd.to_datetime(df_vehicles['date_posted']) 
-
-# Split 'model' column into 'make' and 'model'
-df_vehicles[['make', 'model']] = df_vehicles['model'].str.split(' ', n=1, expand=True)
-
-df_vehicles.rename(columns={
-    'odometer': 'odometer_miles',
-    'date_posted': 'listing_date',
-}, inplace=True)
-
-# New Columns 
-df_vehicles['car_age'] = df_vehicles['model_year'].max() - df_vehicles['model_year']
-df_vehicles['price_per_mile'] = df_vehicles['price'] / df_vehicles['odometer_miles']
-df_vehicles['price_per_mile'].replace([np.inf, -np.inf], np.nan)
-df_vehicles['high_mileage'] = df_vehicles['odometer_miles'].apply(lambda x: 1 if x > 150000 else 0)
-df_vehicles['age_category'] = pd.cut(df_vehicles['car_age'], bins=[0, 5, 10, 20, float('inf')], labels=['<5', '5-10', '10-20', '>20'])
-df_vehicles['listing_date'] = df_vehicles['listing_date'].dt.strftime('%Y-%m-%d')
+# Above this many listings the scatters switch to a binned density heatmap
+SCATTER_POINT_LIMIT = int(os.environ.get('SCATTER_POINT_LIMIT', '5000'))
+
+# Load dataset (cleaned once per process and shared by every session)
+# VEHICLES_BACKEND=memory holds the cleaned frame and its indexes in memory
+# (compact schema unless VEHICLES_COMPACT=0); VEHICLES_BACKEND=store answers
+# every query out-of-core from the store built by vehicles_store.py and
+# VEHICLES_BACKEND=sqlite pushes them down as SQL to the database of vehicles_db.py
+compact_schema = os.environ.get('VEHICLES_COMPACT', '1') != '0'
+backend, load_info = open_backend(compact=compact_schema)
+profiler.lap('load', source=load_info['source'], backend=backend.kind, rows=backend.n_rows, bytes=backend.nbytes)
+
+# Popular makes and make/model pairs are precomputed in the background (once per process)
+warmup_scheduler = warmup.start(backend, SCATTER_POINT_LIMIT)
 
 #|###################################################|#
 #|************ streamlit sidebar section ************|#
@@ -58,12 +53,12 @@ df_vehicles['listing_date'] = df_vehicles['listing_date'].dt.strftime('%Y-%m-%d'
 st.sidebar.header('Filter Options')
 
 # Year Filter
-min_year = int(df_vehicles['model_year'].min())
-max_year = int(df_vehicles['model_year'].max())
+min_year = int(backend.min_year)
+max_year = int(backend.max_year)
 selected_year = st.sidebar.slider('Select Model Year:', min_year, max_year, (min_year, max_year))
 
 # Make Filter
-unique_make = sorted(df_vehicles['make'].dropna().unique())
+unique_make = backend.makes
 
 selected_car = st.sidebar.multiselect(
     'Select Car Make',  
@@ -74,7 +69,7 @@ selected_car = st.sidebar.multiselect(
 
 # Model Filter
 if selected_car:
-    unique_model = sorted(df_vehicles[df_vehicles['make'].isin(selected_car)]['model'].dropna().unique())
+    unique_model = backend.models_for(selected_car)
 else:
     unique_model = []  
 
@@ -93,6 +88,21 @@ compare_cars = st.sidebar.radio(
     ('No', 'Yes')  
 )
 
+# Load timings
+if load_info['source'] == 'cache':
+    st.sidebar.caption(f"Data served from cache in {load_info['seconds'] * 1000:.1f} ms "
+                       f"(built in {load_info['build_seconds']:.2f} s)")
+else:
+    st.sidebar.caption(f"Data loaded from {load_info['source']} in {load_info['seconds']:.2f} s")
+
+# Memory report (compact schema only)
+if load_info['memory'] is not None:
+    with st.sidebar.expander("Memory usage"):
+        total = load_info['memory'].loc['total']
+        st.write(f"{total['bytes_after'] / 1e6:.1f} MB compact vs {total['bytes_before'] / 1e6:.1f} MB standard")
+        st.dataframe(load_info['memory'])
+profiler.lap('sidebar')
+
 
 
 
@@ -141,86 +151,236 @@ compare_cars = st.sidebar.radio(
 
 
 # display full table
-if selected_car or selected_models:
-    df_filtered = df_vehicles[
-        (df_vehicles['make'].isin(selected_car) if selected_car else True) &
-        (df_vehicles['model'].isin(selected_models) if selected_models else True)
-    ]
+# Selections and aggregates are memoized across sessions on the canonical filter state
+filter_key = backend.key(selected_car, selected_models, selected_year)
+# Usage counts rank the selections the warm-up precomputes; a session counts each change once
+if st.session_state.get('recorded_selection') != filter_key[1:3]:
+    st.session_state['recorded_selection'] = filter_key[1:3]
+    warmup.record_selection(backend, selected_car, selected_models)
+n_filtered = results.get_or_compute((filter_key, 'count'), lambda: backend.count(filter_key))
+if backend.kind == 'store':
+    # Only the make/model-year partitions that can hold selected rows are read
+    n_partitions = len(backend.partitions_for(filter_key))
+    st.sidebar.caption(f"Reading {n_partitions} of {len(backend.partitions)} data partitions")
+    profiler.lap('filter', rows=n_filtered, partitions=n_partitions)
+elif backend.kind == 'memory' and profiler is not profiling.NULL_PROFILER:
+    # Only the memory backend holds the filtered rows; sized only when profiling
+    profiler.lap('filter', **profiling.frame_metrics(backend.frame(filter_key)))
 else:
-    df_filtered = df_vehicles 
-
-# If model is selected
-if selected_models:
-    df_filtered = df_filtered[df_filtered['model'].isin(selected_models)]
+    profiler.lap('filter', rows=n_filtered)
 
 # Filtered Data
-st.write(f"Showing {df_filtered.shape[0]} cars matching criteria")
-st.dataframe(df_filtered)
+st.write(f"Showing {n_filtered} cars matching criteria")
+
+# Only the visible page (projected to the chosen columns) is sent to the browser
+table_columns = st.multiselect('Columns', backend.columns, default=backend.columns)
+sort_col, order_col, size_col, page_col = st.columns(4)
+sort_by = sort_col.selectbox('Sort by', ['(none)'] + backend.columns)
+sort_ascending = order_col.radio('Order', ('Ascending', 'Descending'), horizontal=True) == 'Ascending'
+page_size = size_col.selectbox('Rows per page', PAGE_SIZES)
+sort_by = None if sort_by == '(none)' else sort_by
+n_table_pages = page_count(n_filtered, page_size)
+page_number = page_col.number_input(f'Page (of {n_table_pages})', min_value=1, max_value=n_table_pages, value=1)
+df_page = results.get_or_compute(
+    (filter_key, 'page', sort_by, sort_ascending, page_number, page_size, tuple(table_columns)),
+    lambda: backend.page(filter_key, sort_by, sort_ascending, page_number, page_size, table_columns or None)[0])
+st.dataframe(df_page)
+profiler.lap('table', **profiling.frame_metrics(df_page))
 
 # Comparison Section
 if compare_cars == 'Yes':
-    # Comparison logic 
+    # Comparison logic: pick any number of cars by name, looked up in the name index
     st.sidebar.subheader("Select Cars for Comparison")
-    car_1_index = st.sidebar.selectbox("Select the first car to compare", df_filtered.index)
-    car_2_index = st.sidebar.selectbox("Select the second car to compare", df_filtered.index)
-
-    # Get selected car rows
-    car_1_row = df_filtered.loc[car_1_index]
-    car_2_row = df_filtered.loc[car_2_index]
+    car_options = results.get_or_compute((filter_key, 'car_names'), lambda: backend.car_names(filter_key))
+    cars_to_compare = st.sidebar.multiselect("Select the cars to compare", car_options, default=car_options[:2])
 
-    all_attributes = ['price', 'model_year', 'make', 'model', 'condition', 'cylinders', 'fuel', 
-                      'odometer_miles', 'transmission', 'type', 'paint_color', 'is_4wd', 'listing_date', 'days_listed']
-
-    # Comparison Table
-    comparison_df = pd.DataFrame({
-        'Attribute': all_attributes,
-        'Car 1': car_1_row[all_attributes].values,
-        'Car 2': car_2_row[all_attributes].values
-    })
-
-    st.subheader(f"Comparison of {car_1_row['make']} {car_1_row['model']} and {car_2_row['make']} {car_2_row['model']}")
-    st.dataframe(comparison_df)
+    if cars_to_compare:
+        comparison_df = backend.comparison(filter_key, cars_to_compare)
+        st.subheader(f"Comparison of {', '.join(cars_to_compare)}")
+        st.dataframe(comparison_df)
+profiler.lap('comparison')
 
 #|###################################################|#
 #|************ Visualization ************|#
 #|###################################################|#
 
+# Each panel is a fragment: its own widgets rerun only that panel, and its
+# figure is cached on the filter state so unchanged panels are not rebuilt.
+PANELS = ["Price Distribution", "Price vs Condition", "Price vs Age", "Price vs Odometer",
+          "Price by Make", "Correlation Matrix"]
+COMPARISON_PANELS = {"Price vs Condition", "Price vs Age", "Price vs Odometer", "Price by Make"}
+shown_panels = st.sidebar.multiselect("Panels to show", PANELS, default=PANELS)
+
+
+# Figure jobs: the cache key and builder of each panel's figure. Builders make
+# no Streamlit calls, so they can run in the figure pool (see panels.build_figures).
+def price_hist_job(filter_key):
+    def build():
+        price_counts, price_edges = results.get_or_compute((filter_key, 'price_hist'), lambda: backend.price_histogram(filter_key))
+        return histogram_figure(price_counts, price_edges, title="Distribution of Car Prices")
+    return (filter_key, 'fig', 'price_hist'), build
+
+
+def condition_hist_job(filter_key, condition_selected):
+    def build():
+        condition_counts, condition_edges = results.get_or_compute(
+            (filter_key, 'price_hist', condition_selected),
+            lambda: backend.price_histogram(filter_key, condition_selected))
+        return histogram_figure(condition_counts, condition_edges, name=condition_selected,
+                                title=f"Price Distribution for {condition_selected} Condition")
+    return (filter_key, 'fig', 'condition_hist', condition_selected), build
+
+
+def price_age_job(filter_key, n_filtered):
+    def build():
+        if n_filtered <= SCATTER_POINT_LIMIT:
+            import plotly.express as px
+            return px.scatter(backend.frame(filter_key, ['car_age', 'price', 'make']),
+                              x="car_age", y="price", color="make", title="Price vs Age")
+        age_density = results.get_or_compute((filter_key, 'density', 'car_age'), lambda: backend.price_density(filter_key, 'car_age'))
+        return density_figure(*age_density, title="Price vs Age (listing density)", x_title='car_age', y_title='price')
+    return (filter_key, 'fig', 'price_age'), build
+
+
+def price_odometer_job(filter_key, n_filtered):
+    def build():
+        if n_filtered <= SCATTER_POINT_LIMIT:
+            import plotly.express as px
+            return px.scatter(backend.frame(filter_key, ['odometer_miles', 'price', 'make', 'model_year', 'model']),
+                              x="odometer_miles", y="price", color="make", title="Price vs Odometer",
+                              hover_data=['model_year', 'model'])
+        odometer_density = results.get_or_compute((filter_key, 'density', 'odometer_miles'),
+                                                  lambda: backend.price_density(filter_key, 'odometer_miles'))
+        return density_figure(*odometer_density, title="Price vs Odometer (listing density)",
+                              x_title='odometer_miles', y_title='price')
+    return (filter_key, 'fig', 'price_odometer'), build
+
+
+def box_job(filter_key):
+    def build():
+        box_summaries = results.get_or_compute((filter_key, 'box'), lambda: backend.box_summaries(filter_key))
+        return box_figure(box_summaries, title="Price Distribution by Make")
+    return (filter_key, 'fig', 'box'), build
+
+
+def correlation_job(filter_key):
+    def build():
+        corr_matrix = results.get_or_compute((filter_key, 'corr'), lambda: backend.corr(filter_key))
+        # Keyed on the matrix itself: filter states with the same matrix share one figure
+        return results.get_or_compute(('corr_fig', content_key(corr_matrix)), lambda: correlation_figure(corr_matrix))
+    return (filter_key, 'fig', 'corr'), build
+
+
 # Prices Histogram
-st.subheader("Price Distribution")
-fig_price = px.histogram(df_filtered, x='price', nbins=50, title="Distribution of Car Prices")
-st.plotly_chart(fig_price, use_container_width=True)
+@panel("Price Distribution")
+def price_distribution_panel(filter_key):
+    st.subheader("Price Distribution")
+    st.plotly_chart(cached_figure(*price_hist_job(filter_key)), use_container_width=True)
+
 
-# Comparisons
-st.header("Comparisons' Plots")
 # Price vs Condition
-condition_selected = st.selectbox('Select condition to view price distribution', df_filtered['condition'].unique())
-fig1 = px.histogram(df_filtered[df_filtered['condition'] == condition_selected], x='price', color='condition',
-                    title=f"Price Distribution for {condition_selected} Condition")
-st.plotly_chart(fig1)
+@panel("Price vs Condition")
+def price_condition_panel(filter_key):
+    condition_options = results.get_or_compute((filter_key, 'conditions'), lambda: backend.conditions(filter_key))
+    condition_selected = st.selectbox('Select condition to view price distribution', condition_options,
+                                      key='condition_selected')
+    if condition_selected is not None:
+        st.plotly_chart(cached_figure(*condition_hist_job(filter_key, condition_selected)))
+
 
 # Price vs Age
-# st.header("Price vs Age")
-fig2 = px.scatter(df_filtered, x="car_age", y="price", color="make", title="Price vs Age")
-st.plotly_chart(fig2)
+@panel("Price vs Age")
+def price_age_panel(filter_key, n_filtered):
+    st.plotly_chart(cached_figure(*price_age_job(filter_key, n_filtered)))
 
 
 # Price vs Odometer
-#st.header("Price vs Odometer (per Miles)")
-fig3 = px.scatter(df_filtered, x="odometer_miles", y="price", color="make", title="Price vs Odometer", hover_data=['model_year', 'model'])
-st.plotly_chart(fig3, use_container_width=True)
+@panel("Price vs Odometer")
+def price_odometer_panel(filter_key, n_filtered):
+    st.plotly_chart(cached_figure(*price_odometer_job(filter_key, n_filtered)), use_container_width=True)
 
 
-# Price vs Make 
-#st.header("Price Distribution by Make")
-fig4 = px.box(df_filtered, x="make", y="price", title="Price Distribution by Make")
-st.plotly_chart(fig4)
+# Price vs Make
+@panel("Price by Make")
+def price_make_panel(filter_key):
+    st.plotly_chart(cached_figure(*box_job(filter_key)))
 
 
 # Correlation Matrix
-
-#st.header("Correlation Matrix for Numerical Features")
-numeric_df = df_filtered.select_dtypes(include=['float64', 'int64'])
-corr_matrix = numeric_df.corr()
-plt.figure(figsize=(10, 8))
-sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', fmt='.2f')
-st.pyplot()
+@panel("Correlation Matrix")
+def correlation_panel(filter_key):
+    st.plotly_chart(cached_figure(*correlation_job(filter_key)), use_container_width=True)
+
+
+# The figures of every shown panel are built concurrently; each panel renders
+# into its place on the page as soon as its figure is ready.
+shown = [name for name in PANELS if name in shown_panels]
+condition_options = results.get_or_compute((filter_key, 'conditions'), lambda: backend.conditions(filter_key))
+expected_condition = st.session_state.get('condition_selected')
+if expected_condition not in condition_options:
+    expected_condition = condition_options[0] if condition_options else None
+jobs = {
+    "Price Distribution": price_hist_job(filter_key),
+    "Price vs Age": price_age_job(filter_key, n_filtered),
+    "Price vs Odometer": price_odometer_job(filter_key, n_filtered),
+    "Price by Make": box_job(filter_key),
+    "Correlation Matrix": correlation_job(filter_key),
+}
+if expected_condition is not None:
+    jobs["Price vs Condition"] = condition_hist_job(filter_key, expected_condition)
+build_figures({name: jobs[name] for name in shown if name in jobs})
+panel_runs = {
+    "Price Distribution": lambda: price_distribution_panel(filter_key),
+    "Price vs Condition": lambda: price_condition_panel(filter_key),
+    "Price vs Age": lambda: price_age_panel(filter_key, n_filtered),
+    "Price vs Odometer": lambda: price_odometer_panel(filter_key, n_filtered),
+    "Price by Make": lambda: price_make_panel(filter_key),
+    "Correlation Matrix": lambda: correlation_panel(filter_key),
+}
+
+panel_slots = {}
+for name in shown:
+    # Comparisons
+    if name in COMPARISON_PANELS and not COMPARISON_PANELS & set(panel_slots):
+        st.header("Comparisons' Plots")
+    panel_slots[name] = st.container()
+for name in completion_order(shown):
+    with panel_slots[name]:
+        panel_runs[name]()
+
+figures = figure_stage()
+if figures is not None:
+    profiler.lap('charts', figures=figures['figures'], figures_wall_ms=round(figures['wall_ms'], 1),
+                 figures_build_ms_sum=round(figures['build_ms_sum'], 1))
+else:
+    profiler.lap('charts')
+
+# Which panels ran for this interaction, and how long each took
+with st.sidebar.expander("Panel timings"):
+    st.dataframe(timings_table())
+    if figures is not None:
+        # Builds contend for the GIL, so the sum overstates what one-at-a-time building would take
+        st.caption(f"{figures['figures']} figures built concurrently in {figures['wall_ms']:.0f} ms "
+                   f"(their build times sum to {figures['build_ms_sum']:.0f} ms)")
+
+# Debug panel: shared result cache counters
+with st.sidebar.expander("Debug: result cache"):
+    cache_stats = results.stats()
+    st.write(f"{cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['evictions']} evictions")
+    st.write(f"{cache_stats['entries']} entries, {cache_stats['bytes'] / 2**20:.1f} of "
+             f"{cache_stats['max_bytes'] / 2**20:.0f} MB")
+    if warmup_scheduler is not None and warmup_scheduler.last_round is not None:
+        st.write(f"Warm-up round {warmup_scheduler.rounds}: {warmup_scheduler.last_round['selections']} "
+                 f"selections in {warmup_scheduler.last_round['seconds']:.2f} s")
+    if warmup_scheduler is not None and warmup_scheduler.last_error:
+        st.write(f"Warm-up failed: {warmup_scheduler.last_error}")
+
+# Profiling overlay (DASHBOARD_PROFILE=1 or ?profile=1): per-section breakdown, also appended to the trace log
+if profiler is not profiling.NULL_PROFILER:
+    profiler.lap('sidebar panels')
+    with st.sidebar.expander("Profiler", expanded=True):
+        profile_table = profiler.table()
+        st.write(f"Rerun total: {profile_table.loc[~profile_table.index.str.startswith('panel: '), 'ms'].sum():.0f} ms")
+        st.dataframe(profile_table)
+        st.caption(f"Traces appended to {profiler.log_path}")
+    profiler.export()
@@ -1,19 +1,19 @@
 # Standard libraries
 import numpy as np  
 import pandas as pd  
-import matplotlib.pyplot as plt  
-import seaborn as sns  
 import streamlit as st
-import plotly.express as px
 import warnings
 
+from compare import CarNameIndex, comparison_table
+from datasets import load_dataset
+from vehicles_data import cached_derived
+
 
 
 warnings.filterwarnings(action='ignore')
   
 # Config
 pd.set_option('display.max_columns', None) 
-sns.set_style('darkgrid') 
 
 # Streamlit Config
 st.set_page_config(page_title="Used Cars Market", layout="wide")
@@ -24,32 +24,8 @@ st.markdown("""
     <h3 style='text-align: center;'>🛠️ Filter cars and Explore Market trends 🏁</h3>
 """, unsafe_allow_html=True)
 
-# Load dataset
-df_vehicles = pd.read_csv('vehicles_us.csv',low_memory= False)
-
-# Convert data types
-df_vehicles = df_vehicles.astype({
-    'model_year': 'Int64', 
-    'cylinders': 'Int64', 
-    'odometer': 'Int64'})
-df_vehicles['is_4wd'] = df_vehicles['is_4wd'].fillna(0).astype(bool)   
-df_vehicles['date_posted'] = pd.to_datetime(df_vehicles['date_posted']) 
-
-# Split 'model' column into 'make' and 'model'
-df_vehicles[['make', 'model']] = df_vehicles['model'].str.split(' ', n=1, expand=True)
-
-df_vehicles.rename(columns={
-    'odometer': 'odometer_miles',
-    'date_posted': 'listing_date',
-}, inplace=True)
-
-# New Columns 
-df_vehicles['car_age'] = df_vehicles['model_year'].max() - df_vehicles['model_year']
-df_vehicles['price_per_mile'] = df_vehicles['price'] / df_vehicles['odometer_miles']
-df_vehicles['price_per_mile'].replace([np.inf, -np.inf], np.nan)
-df_vehicles['high_mileage'] = df_vehicles['odometer_miles'].apply(lambda x: 1 if x > 150000 else 0)
-df_vehicles['age_category'] = pd.cut(df_vehicles['car_age'], bins=[0, 5, 10, 20, float('inf')], labels=['<5', '5-10', '10-20', '>20'])
-df_vehicles['listing_date'] = df_vehicles['listing_date'].dt.strftime('%Y-%m-%d')
+# Load dataset (shared schema-mapped loader: cleaned once per process and shared, so never edited here)
+df_vehicles, _ = load_dataset('vehicles', compact=False)
 
 #|###################################################|#
 #|************ streamlit sidebar section ************|#
@@ -122,30 +98,19 @@ compare_cars = st.sidebar.radio(
 #     car_2_row = df_filtered.loc[car_2_index]
 
 #########
-# list of car names (make and model) to display in the selectbox
-car_options = df_vehicles[['make', 'model']].apply(lambda x: f"{x['make']} {x['model']}", axis=1).tolist()
-
-# Select cars based on make and model (car name)
-car_1_name = st.sidebar.selectbox("Select the first car to compare", car_options)
-car_2_name = st.sidebar.selectbox("Select the second car to compare", car_options)
-
-# Get the indices of the selected cars
-car_1_index = selected_car[selected_car['make'] + ' ' + selected_car['model'] == car_1_name].index[0]
-car_2_index = selected_car[selected_car['make'] + ' ' + selected_car['model'] == car_2_name].index[0]
+# Deduplicated car names (make and model), each mapped to its listings (built once per loaded frame)
+name_index = cached_derived(df_vehicles, CarNameIndex)
 
-# Get selected car rows
-car_1_row = selected_car.loc[car_1_index]
-car_2_row = selected_car.loc[car_2_index]
+# Select any number of cars by name (car name)
+cars_to_compare = st.sidebar.multiselect("Select the cars to compare", name_index.names,
+                                         default=name_index.names[:2])
 
-all_attributes = ['price', 'model_year', 'make', 'model', 'condition', 'cylinders', 'fuel', 
-                  'odometer_miles', 'transmission', 'type', 'paint_color', 'is_4wd', 'listing_date', 'days_listed']
-
-# Comparison Table
-comparison_df = pd.DataFrame({
-    'Attribute': all_attributes,
-    car_1_name: car_1_row[all_attributes].values,
-    car_2_name: car_2_row[all_attributes].values
-})
+# Comparison Table: first listing of each selected name, found by dictionary lookup
+comparison_df = comparison_table(df_vehicles, name_index, cars_to_compare)
+# Listing dates shown as YYYY-MM-DD, formatted for the compared cars only
+listing_dates = comparison_df['Attribute'] == 'listing_date'
+comparison_df.loc[listing_dates, cars_to_compare] = comparison_df.loc[listing_dates, cars_to_compare].apply(
+    lambda dates: pd.to_datetime(dates).dt.strftime('%Y-%m-%d'))
 
 #############
 
@@ -175,9 +140,9 @@ comparison_df = pd.DataFrame({
 #     })
 
    # Explanatory Sentence
-explanation_text = f"The selected cars to be compared are: {car_1_name} and {car_2_name}. Below are a detailed comparison of both cars."
+explanation_text = f"The selected cars to be compared are: {', '.join(cars_to_compare)}. Below is a detailed comparison of the cars."
 
-st.subheader(f"Comparison of {car_1_row['make']} {car_1_row['model']} and {car_2_row['make']} {car_2_row['model']}")
+st.subheader(f"Comparison of {', '.join(cars_to_compare)}")
 st.write(explanation_text)  # Explanatory sentence under the header
 st.dataframe(comparison_df)
 
@@ -185,6 +150,9 @@ st.dataframe(comparison_df)
 #|************ Visualization ************|#
 #|###################################################|#
 
+# Plotting libraries are imported here, on first use, to keep them off the startup path
+import plotly.express as px
+
 # Prices Histogram
 st.subheader("Price Distribution")
 fig_price = px.histogram(selected_car, x='price', nbins=50, title="Distribution of Car Prices")
@@ -219,6 +187,9 @@ st.plotly_chart(fig4)
 # Correlation Matrix
 
 #st.header("Correlation Matrix for Numerical Features")
+import matplotlib.pyplot as plt
+import seaborn as sns
+sns.set_style('darkgrid')
 numeric_df = selected_car.select_dtypes(include=['float64', 'int64'])
 corr_matrix = numeric_df.corr()
 plt.figure(figsize=(10, 8))
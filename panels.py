@@ -0,0 +1,140 @@
+# Independently rerunning dashboard panels with per-panel timings
+#   FIGURE_WORKERS sets how many figures of one rerun are built at the same time
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import streamlit as st
+
+import profiling
+from result_cache import results
+
+
+# Shared by every session, so concurrent reruns cannot oversubscribe the process
+FIGURE_WORKERS = int(os.environ.get('FIGURE_WORKERS', '4'))
+_figure_pool = ThreadPoolExecutor(max_workers=FIGURE_WORKERS, thread_name_prefix='figures')
+
+
+def start_interaction():
+    """Count a full script run; panel timings are grouped by this counter."""
+    st.session_state['interaction'] = st.session_state.get('interaction', 0) + 1
+    st.session_state.setdefault('panel_log', {})
+    st.session_state['figure_jobs'] = {}
+
+
+def panel(name):
+    """Run the decorated function as a Streamlit fragment and record how long it took.
+
+    A fragment reruns on its own when one of its widgets changes, so touching
+    a panel's control does not rebuild the other panels.
+    """
+    def decorator(func):
+        @st.fragment
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            st.session_state['panel_figure'] = None
+            st.session_state['panel_build_ms'] = None
+            st.session_state['panel_payload'] = None
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            ms = (time.perf_counter() - start) * 1000
+            st.session_state['panel_log'][name] = {
+                'interaction': st.session_state['interaction'],
+                'ms': ms,
+                'figure': st.session_state['panel_figure'],
+                'build_ms': st.session_state['panel_build_ms'],
+            }
+            profiling.current().record(f'panel: {name}', ms, figure=st.session_state['panel_figure'],
+                                       build_ms=st.session_state['panel_build_ms'],
+                                       payload_bytes=st.session_state['panel_payload'])
+            return result
+        return run
+    return decorator
+
+
+def _timed(build):
+    """``build()`` with its duration in ms and the time it finished."""
+    start = time.perf_counter()
+    fig = build()
+    finished = time.perf_counter()
+    return fig, (finished - start) * 1000, finished
+
+
+@functools.cache
+def _import_plotting():
+    """Import plotly (and PIL, which plotly loads while serializing) on the calling thread.
+
+    A module imported for the first time by two threads at once can be seen
+    half-initialized by one of them, so the pool threads must never be first.
+    """
+    import PIL.Image
+    import plotly.express
+    import plotly.graph_objects
+    import plotly.io
+
+
+def build_figures(jobs):
+    """Start building the figures of this rerun in the shared pool.
+
+    ``jobs`` maps a panel name to the ``(key, build)`` that panel passes to
+    :func:`cached_figure`; ``build`` must not call Streamlit. Figures already
+    cached are skipped. Panels pick their figure up when they render.
+    """
+    _import_plotting()
+    started = time.perf_counter()
+    missing = object()
+    st.session_state['figure_jobs'] = {
+        name: (key, _figure_pool.submit(_timed, build), started)
+        for name, (key, build) in jobs.items()
+        if results.get(key, missing) is missing
+    }
+
+
+def completion_order(names):
+    """``names`` reordered: panels with nothing to build first, then the others as their figures finish."""
+    jobs = st.session_state.get('figure_jobs', {})
+    pending = {jobs[name][1]: name for name in names if name in jobs}
+    yield from (name for name in names if name not in jobs)
+    for future in as_completed(pending):
+        yield pending[future]
+
+
+def figure_stage():
+    """Wall time of this rerun's concurrent figure builds and the sum of their own build times (ms), or None."""
+    jobs = st.session_state.get('figure_jobs', {})
+    done = [(future.result(), started) for _, future, started in jobs.values() if future.done()]
+    if not done:
+        return None
+    wall = (max(finished for (_, _, finished), _ in done) - min(started for _, started in done)) * 1000
+    return {'figures': len(done), 'wall_ms': wall, 'build_ms_sum': sum(ms for (_, ms, _), _ in done)}
+
+
+def cached_figure(key, build):
+    """Figure for ``key`` from the shared result cache, a parallel build of this rerun, or built here."""
+    missing = object()
+    fig = results.get(key, missing)
+    job = next((future for job_key, future, _ in st.session_state.get('figure_jobs', {}).values()
+                if job_key == key), None)
+    if fig is missing and job is not None:
+        fig, st.session_state['panel_build_ms'], _ = job.result()
+        fig = results.put(key, fig)
+        st.session_state['panel_figure'] = 'parallel'
+    elif fig is missing:
+        fig, st.session_state['panel_build_ms'], _ = _timed(build)
+        fig = results.put(key, fig)
+        st.session_state['panel_figure'] = 'built'
+    else:
+        st.session_state['panel_figure'] = 'cached'
+    if profiling.current() is not profiling.NULL_PROFILER:
+        st.session_state['panel_payload'] = profiling.figure_payload(fig)
+    return fig
+
+
+def timings_table():
+    """Last run of every panel; ``ran`` marks the panels executed in the current interaction."""
+    log = st.session_state.get('panel_log', {})
+    table = pd.DataFrame.from_dict(log, orient='index', columns=['interaction', 'ms', 'figure', 'build_ms'])
+    table['ran'] = table['interaction'] == st.session_state.get('interaction')
+    return table.round({'ms': 1, 'build_ms': 1})
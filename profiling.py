@@ -0,0 +1,102 @@
+# Opt-in per-rerun profiling: section timings, frame sizes and figure payloads
+#   enable with DASHBOARD_PROFILE=1 or the ?profile=1 query parameter
+import json
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+import streamlit as st
+
+
+LOG_PATH = os.environ.get('DASHBOARD_PROFILE_LOG', 'profile_traces.jsonl')
+
+_log_lock = threading.Lock()
+
+
+def enabled():
+    """True when profiling is switched on for this process or this browser session."""
+    if os.environ.get('DASHBOARD_PROFILE', '0') not in ('', '0'):
+        return True
+    return st.query_params.get('profile', '0') not in ('', '0', 'false')
+
+
+class RerunProfiler:
+    """Timings and sizes of the sections of one script run, exported as a JSON line."""
+
+    def __init__(self, session_id, interaction, log_path=LOG_PATH):
+        self.session_id = session_id
+        self.interaction = interaction
+        self.log_path = log_path
+        self.sections = []
+        self.exported = False
+        self._started = time.time()
+        self._lap = time.perf_counter()
+
+    def lap(self, name, **metrics):
+        """Close a section named ``name`` that started at the previous lap."""
+        now = time.perf_counter()
+        self.sections.append({'section': name, 'ms': (now - self._lap) * 1000, **metrics})
+        self._lap = now
+
+    def record(self, name, ms, **metrics):
+        """Add a separately timed section (e.g. a panel); exported at once after the main run."""
+        self.sections.append({'section': name, 'ms': ms, **metrics})
+        if self.exported:
+            self.export(sections=[self.sections[-1]], kind='fragment')
+
+    def table(self):
+        return pd.DataFrame(self.sections).set_index('section').round(1)
+
+    def export(self, sections=None, kind='rerun'):
+        """Append this run (or just ``sections``) to the trace log."""
+        trace = {
+            'ts': self._started,
+            'session': self.session_id,
+            'interaction': self.interaction,
+            'kind': kind,
+            'sections': self.sections if sections is None else sections,
+        }
+        with _log_lock, open(self.log_path, 'a') as handle:
+            handle.write(json.dumps(trace, default=float) + '\n')
+        self.exported = True
+
+
+class _NullProfiler:
+    """Stand-in used when profiling is off; every call is a no-op."""
+
+    def lap(self, name, **metrics):
+        pass
+
+    def record(self, name, ms, **metrics):
+        pass
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+def start_rerun():
+    """Begin profiling this script run if enabled; returns the profiler (or a no-op one)."""
+    if not enabled():
+        st.session_state['profiler'] = NULL_PROFILER
+        return NULL_PROFILER
+    session_id = st.session_state.setdefault('profile_session', uuid.uuid4().hex[:8])
+    profiler = RerunProfiler(session_id, st.session_state.get('interaction'))
+    st.session_state['profiler'] = profiler
+    return profiler
+
+
+def current():
+    """Profiler of the current session's run (no-op if profiling is off)."""
+    return st.session_state.get('profiler', NULL_PROFILER)
+
+
+def frame_metrics(df):
+    """Row count and in-memory bytes of a frame (shallow: categoricals/numerics are exact)."""
+    return {'rows': len(df), 'bytes': int(df.memory_usage(index=True, deep=False).sum())}
+
+
+def figure_payload(fig):
+    """Bytes of the JSON Streamlit sends to the browser for a Plotly figure."""
+    return len(fig.to_json())
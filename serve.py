@@ -0,0 +1,153 @@
+# Several Streamlit workers behind one local port, sharing one memory-mapped copy of the data
+#   python serve.py --workers 4 --port 8501 [--app my_app.py] [--csv vehicles_us.csv]
+import argparse
+import asyncio
+import itertools
+import os
+import secrets
+import subprocess
+import sys
+import time
+import urllib.request
+
+from vehicles_data import DATA_PATH, build_shared_snapshot, clear_cache
+
+
+FIRST_WORKER_PORT = 8600
+READY_TIMEOUT = 120
+
+
+def start_workers(app, n_workers, first_port=FIRST_WORKER_PORT, shared_path=None):
+    """Start ``n_workers`` headless Streamlit processes on consecutive localhost ports.
+
+    They share a cookie secret, so XSRF cookies issued by one worker are
+    accepted by the others, and map the data from ``shared_path``.
+    """
+    env = dict(os.environ)
+    if shared_path:
+        env['VEHICLES_SHARED'] = os.path.abspath(shared_path)
+    env.setdefault('STREAMLIT_SERVER_COOKIE_SECRET', secrets.token_hex(16))
+    workers = []
+    for port in range(first_port, first_port + n_workers):
+        command = [
+            sys.executable, '-m', 'streamlit', 'run', app,
+            '--server.address', '127.0.0.1',
+            '--server.port', str(port),
+            '--server.headless', 'true',
+            '--browser.gatherUsageStats', 'false',
+        ]
+        workers.append((port, subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL)))
+    return workers
+
+
+def wait_ready(workers, timeout=READY_TIMEOUT):
+    """Block until every worker answers its health check."""
+    deadline = time.monotonic() + timeout
+    for port, process in workers:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'worker on port {port} exited with code {process.returncode}')
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1) as response:
+                    if response.status == 200:
+                        break
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'worker on port {port} not ready after {timeout} s')
+            time.sleep(0.2)
+
+
+def stop_workers(workers):
+    for _, process in workers:
+        process.terminate()
+    for _, process in workers:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def _pipe(reader, writer):
+    try:
+        while data := await reader.read(1 << 16):
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+class RoundRobinProxy:
+    """TCP proxy handing each new connection to the next worker in turn.
+
+    A dashboard session lives on one websocket connection, so a session
+    stays on its worker for as long as the connection is open.
+    """
+
+    def __init__(self, ports):
+        self.ports = list(ports)
+        self._next = itertools.cycle(self.ports)
+
+    async def handle(self, client_reader, client_writer):
+        port = next(self._next)
+        try:
+            worker_reader, worker_writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            client_writer.close()
+            return
+        await asyncio.gather(_pipe(client_reader, worker_writer), _pipe(worker_reader, client_writer))
+
+    async def start(self, host, port):
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def serve(self, host, port):
+        async with await self.start(host, port) as server:
+            await server.serve_forever()
+
+
+def process_memory(pid):
+    """Resident, proportional (shared pages split between processes) and private MB of a process.
+
+    Linux only (reads /proc); returns None elsewhere.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as handle:
+            fields = {line.split()[0].rstrip(':'): int(line.split()[1]) for line in handle if line[0].isupper()}
+    except OSError:
+        return None
+    return {
+        'rss_mb': round(fields['Rss'] / 1024, 1),
+        'pss_mb': round(fields['Pss'] / 1024, 1),
+        'private_mb': round((fields['Private_Clean'] + fields['Private_Dirty']) / 1024, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the dashboard from several workers behind one port.')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 2)))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8501)))
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--app', default='my_app.py')
+    parser.add_argument('--csv', default=DATA_PATH, help='dataset to share (default: %(default)s)')
+    parser.add_argument('--first-worker-port', type=int, default=FIRST_WORKER_PORT)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    shared_path = build_shared_snapshot(args.csv)
+    clear_cache()  # the workers map the file; this process needs no copy of its own
+    print(f'Shared snapshot {shared_path} ready in {time.perf_counter() - start:.2f} s')
+    workers = start_workers(args.app, args.workers, args.first_worker_port, shared_path)
+    try:
+        wait_ready(workers)
+        print(f'{len(workers)} workers ready; serving on http://{args.host}:{args.port}')
+        asyncio.run(RoundRobinProxy(port for port, _ in workers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers(workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# Read-only frames backed by one memory-mapped file, shared between worker processes
+#   write_shared_frame(df, 'vehicles_us.shared.arrow'); df, metadata = read_shared_frame(...)
+import json
+import os
+
+import pandas as pd
+
+
+LAYOUT_KEY = b'shared_frame'
+MASKED_ARRAYS = (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+
+
+def _encode(series):
+    """Split a column into plain NumPy arrays (no Arrow nulls) plus how to reassemble it."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return {'codes': series.cat.codes.to_numpy()}, {
+            'kind': 'category',
+            'categories': dtype.categories.tolist(),
+            'ordered': bool(dtype.ordered),
+        }
+    if isinstance(series.array, MASKED_ARRAYS):
+        values = series.to_numpy(dtype=dtype.numpy_dtype, na_value=dtype.numpy_dtype.type(0))
+        return {'values': values, 'mask': series.isna().to_numpy().view('uint8')}, {
+            'kind': 'masked',
+            'dtype': str(dtype),
+        }
+    if pd.api.types.is_bool_dtype(dtype):
+        return {'values': series.to_numpy().view('uint8')}, {'kind': 'bool'}
+    if pd.api.types.is_datetime64_dtype(dtype):
+        return {'values': series.to_numpy().view('int64')}, {'kind': 'datetime', 'dtype': str(dtype)}
+    if pd.api.types.is_numeric_dtype(dtype):
+        return {'values': series.to_numpy()}, {'kind': 'numeric'}
+    return {'values': series.astype(object).where(series.notna(), None).tolist()}, {'kind': 'object'}
+
+
+def _decode(buffers, layout):
+    """Inverse of :func:`_encode`; every kind except 'object' is a view on the mapped buffers."""
+    kind = layout['kind']
+    if kind == 'category':
+        dtype = pd.CategoricalDtype(layout['categories'], ordered=layout['ordered'])
+        return pd.Categorical.from_codes(buffers['codes'], dtype=dtype, validate=False)
+    if kind == 'masked':
+        array_type = pd.api.types.pandas_dtype(layout['dtype']).construct_array_type()
+        return array_type(buffers['values'], buffers['mask'].view('bool'), copy=False)
+    if kind == 'bool':
+        return buffers['values'].view('bool')
+    if kind == 'datetime':
+        return buffers['values'].view(layout['dtype'])
+    return buffers['values']
+
+
+def write_shared_frame(df, path, metadata=None):
+    """Write ``df`` as an uncompressed Arrow file whose columns map straight onto NumPy.
+
+    Categoricals are stored as their codes, nullable columns as values plus a
+    mask, booleans and datetimes as their raw bytes, so :func:`read_shared_frame`
+    can rebuild every numeric and categorical column without copying. Written
+    next to ``path`` and swapped in atomically.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    arrays, names, layouts = [], [], {}
+    for column in df.columns:
+        buffers, layout = _encode(df[column])
+        layout['buffers'] = []
+        for part, values in buffers.items():
+            name = f'{column}/{part}'
+            arrays.append(pa.array(values))
+            names.append(name)
+            layout['buffers'].append(part)
+        layouts[column] = layout
+
+    table = pa.Table.from_arrays(arrays, names=names)
+    table = table.replace_schema_metadata({
+        LAYOUT_KEY: json.dumps({'columns': list(df.columns), 'layouts': layouts, 'metadata': metadata or {}}).encode(),
+    })
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    # One record batch, so each column is a single contiguous buffer in the file
+    feather.write_feather(table, tmp_path, compression='uncompressed', chunksize=max(1, table.num_rows))
+    os.replace(tmp_path, path)
+
+
+def read_shared_frame(path):
+    """Memory-map a file written by :func:`write_shared_frame`; return the frame and its metadata.
+
+    The frame's arrays point into the page cache, so every process mapping
+    the same file shares one physical copy. They are read-only.
+    """
+    import pyarrow.feather as feather
+
+    table = feather.read_table(path, memory_map=True)
+    header = json.loads(table.schema.metadata[LAYOUT_KEY])
+    columns = []
+    for column in header['columns']:
+        layout = header['layouts'][column]
+        buffers = {}
+        for part in layout['buffers']:
+            chunked = table.column(f'{column}/{part}')
+            if layout['kind'] == 'object':
+                buffers[part] = chunked.to_numpy(zero_copy_only=False)
+            else:
+                array = chunked.chunk(0) if chunked.num_chunks == 1 else chunked.combine_chunks()
+                buffers[part] = array.to_numpy(zero_copy_only=chunked.num_chunks == 1)
+        columns.append(pd.Series(_decode(buffers, layout), name=column, copy=False))
+    # Concatenating Series keeps one block per column; a DataFrame built from
+    # a dict would consolidate the NumPy columns, i.e. copy them out of the map
+    df = pd.concat(columns, axis=1, copy=False) if columns else pd.DataFrame(index=pd.RangeIndex(table.num_rows))
+    return df, header['metadata']
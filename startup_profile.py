@@ -0,0 +1,93 @@
+# Cold-start profile of a dashboard: import-time breakdown and time to first render
+#   python startup_profile.py [--app my_app.py] [--top 15] [--budget 8] [--json startup.json]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+
+def parse_importtime(stderr):
+    """Cumulative import seconds per top-level package from ``python -X importtime`` output."""
+    per_package = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # header row
+        # Nested imports are indented; only top-level entries are summed
+        if name.startswith(' ') and not name.startswith('  '):
+            per_package[name.strip().split('.')[0]] += int(cumulative) / 1e6
+    return dict(per_package)
+
+
+def _child(app):
+    """Run ``app`` once headlessly and print how long the first render took."""
+    from streamlit.testing.v1 import AppTest
+
+    start = time.perf_counter()
+    at = AppTest.from_file(os.path.abspath(app), default_timeout=600).run()
+    print(json.dumps({
+        'first_render_s': time.perf_counter() - start,
+        'exceptions': [exception.message for exception in at.exception],
+    }))
+
+
+def profile(app, cwd=None):
+    """Profile a cold start of ``app`` in a fresh interpreter."""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--child', os.path.abspath(app)],
+        cwd=cwd, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(completed.stderr)
+    return {
+        'app': app,
+        'process_wall_s': wall,
+        'first_render_s': result['first_render_s'],
+        'import_total_s': sum(imports.values()),
+        'imports_s': dict(sorted(imports.items(), key=lambda item: -item[1])),
+        'exceptions': result['exceptions'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile the cold start of a Streamlit dashboard.')
+    parser.add_argument('--app', default='my_app.py')
+    parser.add_argument('--cwd', default=None, help='directory to run in (where the data files are)')
+    parser.add_argument('--top', type=int, default=15, help='number of packages to list')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='fail (exit 1) if the first render takes longer than this many seconds')
+    parser.add_argument('--json', default=None, help='also write the report to this file')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(args.child)
+        return 0
+
+    report = profile(args.app, args.cwd)
+    print(f"{'package':<30}{'import (s)':>12}")
+    for package, seconds in list(report['imports_s'].items())[:args.top]:
+        print(f'{package:<30}{seconds:>12.3f}')
+    print(f"\nimports total      {report['import_total_s']:.2f} s")
+    print(f"first render       {report['first_render_s']:.2f} s (app script, after interpreter start)")
+    print(f"process wall time  {report['process_wall_s']:.2f} s")
+    for message in report['exceptions']:
+        print(f'app raised: {message}')
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    if args.budget is not None and report['first_render_s'] > args.budget:
+        print(f"over budget: {report['first_render_s']:.2f} s > {args.budget:.2f} s")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# Server-side pagination of the listings table
+import math
+
+import numpy as np
+
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+def sorted_positions(df_vehicles, positions, sort_by=None, ascending=True):
+    """Row positions of a selection in display order (missing sort values last).
+
+    ``positions`` is a FilterIndex selection (None means every row).
+    """
+    if positions is None:
+        positions = np.arange(len(df_vehicles))
+    if sort_by is None:
+        return positions
+    values = df_vehicles[sort_by].iloc[positions].reset_index(drop=True)
+    order = values.sort_values(ascending=ascending, na_position='last', kind='stable').index.to_numpy()
+    return positions[order]
+
+
+def page_count(total_rows, page_size):
+    """Number of pages needed for ``total_rows`` (at least one, even when empty)."""
+    return max(1, math.ceil(total_rows / page_size))
+
+
+def page(df_vehicles, ordered_positions, page_number=1, page_size=PAGE_SIZES[0], columns=None):
+    """One page of rows, projected to ``columns``, plus the total row and page counts.
+
+    Only the rows and columns of the requested page are materialized.
+    """
+    total_rows = len(ordered_positions)
+    n_pages = page_count(total_rows, page_size)
+    page_number = min(max(1, page_number), n_pages)
+    start = (page_number - 1) * page_size
+    page_rows = ordered_positions[start:start + page_size]
+    if columns is None:
+        return df_vehicles.iloc[page_rows], total_rows, n_pages
+    column_positions = [df_vehicles.columns.get_loc(column) for column in columns]
+    return df_vehicles.iloc[page_rows, column_positions], total_rows, n_pages
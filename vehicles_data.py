@@ -0,0 +1,364 @@
+# Loading and cleaning of the vehicles_us.csv listings
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from features import add_vehicle_features
+
+
+DATA_PATH = 'vehicles_us.csv'
+
+# Low-cardinality text columns stored as categoricals
+CATEGORY_COLUMNS = ['make', 'model', 'condition', 'fuel', 'type', 'paint_color']
+
+# Extra text columns made categorical in the compact schema
+COMPACT_CATEGORY_COLUMNS = CATEGORY_COLUMNS + ['transmission']
+
+# Key of the schema metadata entry recording which CSV a snapshot was built from
+SNAPSHOT_META_KEY = b'vehicles_source'
+
+# Version of the cleaned frame's schema: bump whenever clean_vehicles, compact_vehicles or
+# features.add_vehicle_features change their output, so snapshots built by older code are rebuilt
+SNAPSHOT_VERSION = 1
+
+# Compact frame mapped read-only by every worker of serve.py (see shared_frame.py)
+SHARED_PATH = os.environ.get('VEHICLES_SHARED')
+
+# Process-wide cache: every Streamlit session imports this module once, so the
+# cleaned frame is built once per process and shared by all sessions. The
+# store and SQLite backends are cached here too; reentrant because building
+# the database loads the cleaned frame.
+_cache = {}
+_cache_lock = threading.RLock()
+
+
+def split_model(model):
+    """'make model' strings as a two-column (make, model) frame; one-word names get a missing model."""
+    return model.str.split(' ', n=1, expand=True).reindex(columns=[0, 1])
+
+
+def clean_vehicles(df_vehicles, reference_year=None, categories=None):
+    """Apply the dashboard's type conversions and derived columns to a raw frame.
+
+    ``reference_year`` (default: the newest model year in the frame) dates
+    ``car_age`` and ``categories`` maps category columns to fixed category
+    lists, so chunks of one file clean to the same values and dtypes.
+    """
+    categories = categories or {}
+    # Convert data types
+    df_vehicles = df_vehicles.astype({
+        'model_year': 'Int64',
+        'cylinders': 'Int64',
+        'odometer': 'Int64'})
+    df_vehicles['is_4wd'] = df_vehicles['is_4wd'].fillna(0).astype(bool)
+    df_vehicles['date_posted'] = pd.to_datetime(df_vehicles['date_posted'])
+
+    # Split 'model' column into 'make' and 'model'
+    df_vehicles[['make', 'model']] = split_model(df_vehicles['model'])
+    df_vehicles = df_vehicles.astype({
+        column: pd.CategoricalDtype(categories[column]) if column in categories else 'category'
+        for column in CATEGORY_COLUMNS})
+
+    df_vehicles = df_vehicles.rename(columns={
+        'odometer': 'odometer_miles',
+        'date_posted': 'listing_date',
+    })
+
+    # New Columns
+    df_vehicles = add_vehicle_features(df_vehicles, reference_year)
+    return df_vehicles
+
+
+def _smallest_int_dtype(series):
+    """Narrowest integer dtype holding every value of ``series`` (nullable if it has NAs)."""
+    low, high = series.min(), series.max()
+    for bits in (8, 16, 32):
+        info = np.iinfo(f'int{bits}')
+        if pd.isna(low) or (info.min <= low and high <= info.max):
+            break
+    else:
+        bits = 64
+    return f'Int{bits}' if series.isna().any() else f'int{bits}'
+
+
+def compact_vehicles(df_vehicles):
+    """Return a memory-compact copy of a cleaned frame.
+
+    Text columns become categoricals, integer columns are downcast to the
+    narrowest width that fits (int8/int16 for cylinders, model_year and
+    car_age), ``high_mileage`` becomes bool and ``listing_date`` stays a
+    native datetime64.
+    """
+    df_compact = df_vehicles.copy()
+    for column in COMPACT_CATEGORY_COLUMNS:
+        if df_compact[column].dtype != 'category':
+            df_compact[column] = df_compact[column].astype('category')
+    for column in df_compact.select_dtypes(include='integer').columns:
+        df_compact[column] = df_compact[column].astype(_smallest_int_dtype(df_compact[column]))
+    df_compact['high_mileage'] = df_compact['high_mileage'].astype(bool)
+    df_compact['price_per_mile'] = df_compact['price_per_mile'].astype('Float32')
+    df_compact['listing_date'] = pd.to_datetime(df_compact['listing_date'])
+    return df_compact
+
+
+def memory_report(df_before, df_after):
+    """Bytes per column of two representations of the same frame."""
+    report = pd.DataFrame({
+        'dtype_before': df_before.dtypes.astype(str),
+        'bytes_before': df_before.memory_usage(index=False, deep=True),
+        'dtype_after': df_after.dtypes.astype(str),
+        'bytes_after': df_after.memory_usage(index=False, deep=True),
+    })
+    report.loc['total'] = ['', report['bytes_before'].sum(), '', report['bytes_after'].sum()]
+    report['saved_pct'] = (100 * (1 - report['bytes_after'] / report['bytes_before'])).round(1)
+    return report
+
+
+def file_fingerprint(path):
+    """Cheap identity of a file on disk: a new drop changes its mtime or size."""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents, used when mtimes differ (e.g. after a fresh checkout)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_path_for(path):
+    """Default location of the columnar snapshot built from ``path``."""
+    return os.path.splitext(path)[0] + '.feather'
+
+
+def _source_of(path):
+    """What a snapshot records about the CSV and the code version it was built from."""
+    mtime_ns, size = file_fingerprint(path)
+    return {'mtime_ns': mtime_ns, 'size': size, 'sha256': file_digest(path), 'version': SNAPSHOT_VERSION}
+
+
+def _is_source(source, path):
+    """True when ``source`` was written by this schema version and ``path`` is still its CSV.
+
+    A snapshot of this version is trusted as-is without the CSV, since deploys may ship only the snapshot.
+    """
+    if source.get('version') != SNAPSHOT_VERSION:
+        return False
+    if not os.path.exists(path):
+        return True
+    mtime_ns, size = file_fingerprint(path)
+    if source.get('size') != size:
+        return False
+    return source.get('mtime_ns') == mtime_ns or source.get('sha256') == file_digest(path)
+
+
+def build_snapshot(path=DATA_PATH, snapshot_path=None, df_vehicles=None):
+    """Write the cleaned frame as an uncompressed Feather (Arrow IPC) file.
+
+    Uncompressed Arrow files can be memory-mapped on load. The source CSV's
+    fingerprint and digest and the SNAPSHOT_VERSION are stored in the schema
+    metadata so a stale snapshot is detected and rebuilt. Returns the cleaned frame.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    snapshot_path = snapshot_path or snapshot_path_for(path)
+    if df_vehicles is None:
+        df_vehicles = clean_vehicles(pd.read_csv(path, low_memory=False))
+
+    table = pa.Table.from_pandas(df_vehicles, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        SNAPSHOT_META_KEY: json.dumps(_source_of(path)).encode(),
+    })
+
+    # Write next to the target and swap in atomically so readers never see a partial file
+    tmp_path = f'{snapshot_path}.tmp-{os.getpid()}'
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, snapshot_path)
+    return df_vehicles
+
+
+def read_snapshot(path=DATA_PATH, snapshot_path=None):
+    """Memory-map the snapshot of ``path`` and return it as a frame.
+
+    Returns None when there is no snapshot or it was built from a different
+    version of the CSV or by a different SNAPSHOT_VERSION. If the CSV itself
+    is missing, a snapshot of this version is trusted as-is (deploys may ship
+    only the snapshot).
+    """
+    import pyarrow.feather as feather
+
+    snapshot_path = snapshot_path or snapshot_path_for(path)
+    if not os.path.exists(snapshot_path):
+        return None
+
+    table = feather.read_table(snapshot_path, memory_map=True)
+    if not _is_source(json.loads((table.schema.metadata or {}).get(SNAPSHOT_META_KEY, b'{}')), path):
+        return None
+    return table.to_pandas()
+
+
+def build_shared_snapshot(path=DATA_PATH, shared_path=None):
+    """Write the compact frame in the zero-copy layout of :mod:`shared_frame`; returns the path.
+
+    Worker processes started with ``VEHICLES_SHARED`` pointing at this file
+    map it instead of each holding a private copy of the data.
+    """
+    from shared_frame import write_shared_frame
+
+    shared_path = shared_path or os.path.splitext(path)[0] + '.shared.arrow'
+    df_vehicles, _ = load_vehicles(path, compact=True)
+    write_shared_frame(df_vehicles, shared_path, {'source': _source_of(path)})
+    return shared_path
+
+
+def read_shared_snapshot(path=DATA_PATH, shared_path=SHARED_PATH):
+    """The compact frame mapped from ``shared_path``, or None when missing or built from another CSV."""
+    from shared_frame import read_shared_frame
+
+    if not shared_path or not os.path.exists(shared_path):
+        return None
+    df_vehicles, metadata = read_shared_frame(shared_path)
+    return df_vehicles if _is_source(metadata.get('source', {}), path) else None
+
+
+def _build_frame(path, use_snapshot):
+    """Produce the cleaned frame, preferring a fresh snapshot over the CSV."""
+    if not use_snapshot:
+        return clean_vehicles(pd.read_csv(path, low_memory=False)), 'csv'
+
+    df_vehicles = read_snapshot(path)
+    if df_vehicles is not None:
+        return df_vehicles, 'snapshot'
+
+    df_vehicles = clean_vehicles(pd.read_csv(path, low_memory=False))
+    try:
+        build_snapshot(path, df_vehicles=df_vehicles)
+    except OSError:
+        # Read-only filesystems still get a working (CSV-backed) app
+        pass
+    return df_vehicles, 'csv'
+
+
+def cached_frame(key, fingerprint, build):
+    """Frame (or backend) built by ``build()`` for ``key``, reused while the source ``fingerprint`` is unchanged.
+
+    ``build`` returns ``(df, source, memory)``. Returns the frame and a dict
+    describing how it was obtained (``source`` is 'cache' on a hit).
+    """
+    start = time.perf_counter()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry['fingerprint'] == fingerprint:
+            entry['hits'] += 1
+            return entry['df'], {
+                'source': 'cache',
+                'seconds': time.perf_counter() - start,
+                'build_seconds': entry['build_seconds'],
+                'hits': entry['hits'],
+                'memory': entry['memory'],
+            }
+
+        df, source, memory = build()
+        build_seconds = time.perf_counter() - start
+        _cache[key] = {
+            'df': df,
+            'fingerprint': fingerprint,
+            'build_seconds': build_seconds,
+            'hits': 0,
+            'memory': memory,
+            'derived': {},
+        }
+
+    return df, {
+        'source': source,
+        'seconds': build_seconds,
+        'build_seconds': build_seconds,
+        'hits': 0,
+        'memory': memory,
+    }
+
+
+def load_vehicles(path=DATA_PATH, use_snapshot=True, compact=False):
+    """Return the cleaned vehicles frame and a dict describing how it was obtained.
+
+    The frame is cached per process and keyed on the file fingerprint, so a
+    rerun only pays for an ``os.stat`` while a replaced CSV is re-read on the
+    next call. Cold loads come from the columnar snapshot when it is up to
+    date, otherwise from the CSV (which then refreshes the snapshot). The
+    returned frame is shared between sessions and must be treated as read-only.
+
+    With ``compact=True`` the frame uses the compact schema of
+    :func:`compact_vehicles` and the info dict carries a ``memory`` report
+    comparing it to the standard schema. When ``VEHICLES_SHARED`` names an
+    up-to-date shared snapshot, the compact frame is mapped from it instead
+    (source 'shared', no memory report).
+    """
+    if os.path.exists(path) or not use_snapshot:
+        fingerprint = file_fingerprint(path)
+    else:
+        fingerprint = file_fingerprint(snapshot_path_for(path))
+
+    def build():
+        if compact and use_snapshot:
+            df_shared = read_shared_snapshot(path)
+            if df_shared is not None:
+                return df_shared, 'shared', None
+        df_vehicles, source = _build_frame(path, use_snapshot)
+        memory = None
+        if compact:
+            df_compact = compact_vehicles(df_vehicles)
+            memory = memory_report(df_vehicles, df_compact)
+            df_vehicles = df_compact
+        return df_vehicles, source, memory
+
+    return cached_frame((os.path.abspath(path), compact), fingerprint, build)
+
+
+def cached_derived(df, build):
+    """``build(df)`` for a frame returned by :func:`cached_frame`, built once and kept in the frame's entry.
+
+    The result is dropped together with the frame when the source changes, so
+    structures that hold the frame (e.g. a backend) do not keep old copies alive.
+    Frames not in the cache get a fresh ``build(df)``.
+    """
+    with _cache_lock:
+        entry = next((entry for entry in _cache.values() if entry['df'] is df), None)
+        if entry is None:
+            return build(df)
+        if build not in entry['derived']:
+            entry['derived'][build] = build(df)
+        return entry['derived'][build]
+
+
+def clear_cache():
+    """Drop every cached frame (the next load re-reads from disk)."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def main(argv=None):
+    """Build the columnar snapshot offline, e.g. as a deploy build step."""
+    parser = argparse.ArgumentParser(description='Build the columnar snapshot of the vehicles CSV.')
+    parser.add_argument('--csv', default=DATA_PATH, help='source CSV (default: %(default)s)')
+    parser.add_argument('--out', default=None, help='snapshot path (default: next to the CSV, .feather)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    df_vehicles = build_snapshot(args.csv, args.out)
+    print(f"Wrote {args.out or snapshot_path_for(args.csv)}: {len(df_vehicles)} rows "
+          f"in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
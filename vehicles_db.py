@@ -0,0 +1,387 @@
+# Embedded SQLite database of the cleaned listings, with filters and aggregates pushed down as SQL
+#   python vehicles_db.py --csv vehicles_us.csv --out vehicles.sqlite [--check]
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+from compare import COMPARE_ATTRIBUTES, listing_table
+from filters import models_offered, selection_key
+from table_view import page_count
+from vehicles_data import DATA_PATH, SNAPSHOT_VERSION, cached_frame, file_fingerprint, load_vehicles
+
+
+DB_PATH = 'vehicles.sqlite'
+TABLE = 'vehicles'
+
+# Original position of each listing, the table's primary key and default order
+ROW_ID = 'row_id'
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _sql_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _sql_values(series):
+    """Column values as Python objects SQLite accepts (None for missing, ISO text for dates)."""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        series = series.dt.strftime('%Y-%m-%d %H:%M:%S')
+    elif pd.api.types.is_bool_dtype(series.dtype):
+        series = series.astype('int64')
+    values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def build_database(path=DATA_PATH, db_path=DB_PATH, df_vehicles=None):
+    """Write the cleaned (compact) frame to a SQLite file indexed on make, model and model_year.
+
+    The schema, category orders and source fingerprint are kept in a ``meta``
+    table so frames read back get the dashboard's dtypes and a stale database
+    is detected. The file is swapped in atomically. Returns the metadata.
+    """
+    if df_vehicles is None:
+        df_vehicles, _ = load_vehicles(path, compact=True)
+    columns = list(df_vehicles.columns)
+    numeric_columns = list(df_vehicles.select_dtypes(include='number').columns)
+    values = df_vehicles[numeric_columns].to_numpy(dtype='float64', na_value=np.nan)
+    years = df_vehicles['model_year'].dropna()
+
+    mtime_ns, size = file_fingerprint(path)
+    meta = {
+        'source': {'path': os.path.abspath(path), 'mtime_ns': mtime_ns, 'size': size, 'version': SNAPSHOT_VERSION},
+        'created': time.time(),
+        'rows': len(df_vehicles),
+        'columns': columns,
+        'dtypes': {column: str(dtype) for column, dtype in df_vehicles.dtypes.items()},
+        'categories': {
+            column: df_vehicles[column].cat.categories.tolist()
+            for column in df_vehicles.select_dtypes(include='category').columns
+        },
+        'numeric_columns': numeric_columns,
+        'column_means': np.nan_to_num(np.nanmean(values, axis=0)).tolist() if len(values) else [],
+        'years': None if years.empty else [int(years.min()), int(years.max())],
+    }
+
+    tmp_path = f'{db_path}.tmp-{os.getpid()}'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        column_sql = ', '.join(f'{_quote(column)} {_sql_type(df_vehicles[column].dtype)}' for column in columns)
+        connection.execute(f'CREATE TABLE {TABLE} ({ROW_ID} INTEGER PRIMARY KEY, {column_sql})')
+        rows = zip(range(len(df_vehicles)), *(_sql_values(df_vehicles[column]) for column in columns))
+        placeholders = ', '.join('?' * (len(columns) + 1))
+        connection.executemany(f'INSERT INTO {TABLE} VALUES ({placeholders})', rows)
+        for column in ('make', 'model', 'model_year'):
+            connection.execute(f'CREATE INDEX idx_{column} ON {TABLE} ({_quote(column)})')
+        connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+        connection.execute("INSERT INTO meta VALUES ('vehicles', ?)", (json.dumps(meta),))
+        connection.execute('ANALYZE')
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, db_path)
+    return meta
+
+
+def read_meta(db_path=DB_PATH):
+    """Metadata stored by :func:`build_database`, or None when there is no database."""
+    if not os.path.exists(db_path):
+        return None
+    connection = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        return json.loads(connection.execute("SELECT value FROM meta WHERE key = 'vehicles'").fetchone()[0])
+    finally:
+        connection.close()
+
+
+class VehicleDatabase:
+    """Make/model/year selections answered by SQL over the embedded database.
+
+    Offers the same selection API as :class:`backends.MemoryBackend`. Filters
+    become WHERE clauses served by the column indexes; counts, histogram bins,
+    per-make price counts and the correlation sums are computed by SQLite, so
+    only aggregates and the rows of one page leave the database. Each thread
+    (Streamlit session) gets its own read-only connection.
+    """
+
+    kind = 'sqlite'
+
+    def __init__(self, db_path, meta):
+        self.db_path = db_path
+        self.meta = meta
+        self.token = (os.path.abspath(db_path), meta['created'])
+        self.n_rows = meta['rows']
+        self.nbytes = None
+        self.columns = meta['columns']
+        self.min_year, self.max_year = meta['years'] or (None, None)
+        self.compare_attributes = [column for column in COMPARE_ATTRIBUTES if column in self.columns]
+        self._local = threading.local()
+        self.makes = [make for (make,) in self.query(
+            f'SELECT DISTINCT make FROM {TABLE} WHERE make IS NOT NULL ORDER BY make')]
+        self.models_by_make = {}
+        for make, model in self.query(f'SELECT DISTINCT make, model FROM {TABLE} '
+                                      'WHERE make IS NOT NULL AND model IS NOT NULL ORDER BY make, model'):
+            self.models_by_make.setdefault(make, []).append(model)
+
+    def query(self, sql, params=()):
+        """Rows of ``sql`` on this thread's connection."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=False)
+            self._local.connection = connection
+        return connection.execute(sql, params).fetchall()
+
+    def models_for(self, makes):
+        """Sorted models offered by any of ``makes``."""
+        return models_offered(self.models_by_make, makes)
+
+    def key(self, makes=(), models=(), year_range=None):
+        """Canonical, hashable form of a selection, as :meth:`filters.FilterIndex.key`."""
+        return selection_key(self.token, makes, models, year_range, self.min_year, self.max_year)
+
+    @staticmethod
+    def where(selection, condition=None):
+        """WHERE clause and parameters of a selection (optionally one condition)."""
+        _, makes, models, year_range = selection
+        clauses, params = ['1'], []
+        if makes:
+            clauses.append(f"make IN ({', '.join('?' * len(makes))})")
+            params += list(makes)
+        if models:
+            clauses.append(f"model IN ({', '.join('?' * len(models))})")
+            params += list(models)
+        if year_range is not None:
+            clauses.append('model_year BETWEEN ? AND ?')
+            params += list(year_range)
+        if condition is not None:
+            clauses.append('condition = ?')
+            params.append(condition)
+        return ' AND '.join(clauses), params
+
+    def _frame(self, rows, columns):
+        """Rows fetched as ``(row_id, *columns)`` as a frame with the dashboard's dtypes."""
+        df_rows = pd.DataFrame(rows, columns=[ROW_ID] + list(columns)).set_index(ROW_ID).rename_axis(None)
+        for column in columns:
+            dtype = self.meta['dtypes'][column]
+            if column in self.meta['categories']:
+                df_rows[column] = df_rows[column].astype(pd.CategoricalDtype(self.meta['categories'][column]))
+            elif dtype.startswith('datetime64'):
+                df_rows[column] = pd.to_datetime(df_rows[column])
+            else:
+                df_rows[column] = df_rows[column].astype(dtype)
+        return df_rows
+
+    def _select(self, columns, selection, suffix='', params=()):
+        where, where_params = self.where(selection)
+        column_sql = ', '.join([ROW_ID] + [_quote(column) for column in columns])
+        rows = self.query(f'SELECT {column_sql} FROM {TABLE} WHERE {where} {suffix}', where_params + list(params))
+        return self._frame(rows, columns)
+
+    def count(self, selection):
+        where, params = self.where(selection)
+        return self.query(f'SELECT COUNT(*) FROM {TABLE} WHERE {where}', params)[0][0]
+
+    def frame(self, selection, columns=None):
+        """The selected rows in file order; only for selections known to be small."""
+        return self._select(list(columns or self.columns), selection, f'ORDER BY {ROW_ID}')
+
+    def _order_expression(self, column):
+        """ORDER BY expression of ``column``; categoricals follow their category order."""
+        categories = self.meta['categories'].get(column)
+        if categories is None or categories == sorted(categories):
+            return _quote(column)
+        cases = ' '.join(f"WHEN '{str(category).replace(chr(39), chr(39) * 2)}' THEN {position}"
+                         for position, category in enumerate(categories))
+        return f'CASE {_quote(column)} {cases} END'
+
+    def page(self, selection, sort_by=None, ascending=True, page_number=1, page_size=25, columns=None):
+        """One page of the selection, sorted and cut by SQLite (ORDER BY ... LIMIT/OFFSET)."""
+        total_rows = self.count(selection)
+        n_pages = page_count(total_rows, page_size)
+        page_number = min(max(1, page_number), n_pages)
+        order = ROW_ID
+        if sort_by is not None:
+            order = f"{self._order_expression(sort_by)} {'ASC' if ascending else 'DESC'} NULLS LAST, {ROW_ID}"
+        df_page = self._select(list(columns or self.columns), selection, f'ORDER BY {order} LIMIT ? OFFSET ?',
+                               (page_size, (page_number - 1) * page_size))
+        return df_page, total_rows, n_pages
+
+    def car_names(self, selection):
+        """Sorted 'make model' names with a listing in the selection."""
+        where, params = self.where(selection)
+        pairs = self.query(f'SELECT DISTINCT make, model FROM {TABLE} WHERE {where}', params)
+        return sorted(f"{'nan' if make is None else make} {'nan' if model is None else model}" for make, model in pairs)
+
+    def comparison(self, selection, names, attributes=None):
+        """Attribute-by-car table of the first listing of each name in the selection."""
+        attributes = attributes or self.compare_attributes
+        where, params = self.where(selection)
+        name_sql = "COALESCE(make, 'nan') || ' ' || COALESCE(model, 'nan')"
+        column_sql = ', '.join([ROW_ID] + [_quote(column) for column in attributes])
+        rows = []
+        for name in names:
+            rows += self.query(f'SELECT {column_sql} FROM {TABLE} WHERE {where} AND {name_sql} = ? '
+                               f'ORDER BY {ROW_ID} LIMIT 1', params + [name])
+        return listing_table(self._frame(rows, attributes), names, attributes)
+
+    def conditions(self, selection):
+        """Conditions present in the selection, in order of first appearance."""
+        where, params = self.where(selection)
+        return [condition for condition, _ in self.query(
+            f'SELECT condition, MIN({ROW_ID}) AS first FROM {TABLE} WHERE {where} AND condition IS NOT NULL '
+            'GROUP BY condition ORDER BY first', params)]
+
+    def _bin_counts(self, where, params, columns, edges):
+        """Histogram of ``columns`` over fixed-width ``edges``, binned in SQL.
+
+        Rows lying exactly on an inner edge are binned in NumPy instead, so
+        float rounding in the SQL bin arithmetic cannot move them to the
+        neighbouring bin.
+        """
+        bin_sql, exact_sql, bin_params, exact_params = [], [], [], []
+        for column, column_edges in zip(columns, edges):
+            bins = len(column_edges) - 1
+            step = (column_edges[-1] - column_edges[0]) / bins
+            bin_sql.append(f'MIN(CAST(({_quote(column)} - ?) / ? AS INTEGER), {bins - 1})')
+            bin_params += [float(column_edges[0]), step]
+            exact_sql.append(f"{_quote(column)} IN ({', '.join('?' * (bins - 1))})")
+            exact_params += [float(edge) for edge in column_edges[1:-1]]
+        known = ' AND '.join(f'{_quote(column)} IS NOT NULL' for column in columns)
+        counts = np.zeros([len(column_edges) - 1 for column_edges in edges], dtype='int64')
+
+        for *bin_index, n in self.query(
+                f"SELECT {', '.join(bin_sql)}, COUNT(*) FROM {TABLE} WHERE {where} AND {known} "
+                f"AND NOT ({' OR '.join(exact_sql)}) GROUP BY {', '.join(str(i + 1) for i in range(len(columns)))}",
+                bin_params + params + exact_params):
+            counts[tuple(bin_index)] += n
+        exact = self.query(
+            f"SELECT {', '.join(_quote(column) for column in columns)}, COUNT(*) FROM {TABLE} WHERE {where} AND {known} "
+            f"AND ({' OR '.join(exact_sql)}) GROUP BY {', '.join(str(i + 1) for i in range(len(columns)))}",
+            params + exact_params)
+        if exact:
+            exact = np.array(exact, dtype='float64')
+            counts += np.histogramdd(exact[:, :-1], bins=edges, weights=exact[:, -1])[0].astype('int64')
+        return counts
+
+    def price_histogram(self, selection, condition=None):
+        """Price counts and bin edges; extremes and bin counts both come from SQL."""
+        where, params = self.where(selection, condition)
+        low, high = self.query(f'SELECT MIN(price), MAX(price) FROM {TABLE} WHERE {where}', params)[0]
+        edges = aggregates.range_edges(low, high)
+        if low is None:
+            return np.zeros(len(edges) - 1, dtype='int64'), edges
+        return self._bin_counts(where, params, ['price'], [edges]), edges
+
+    def price_density(self, selection, x, bins=(60, 60)):
+        """2D counts of ``x`` against price, binned in SQL like :meth:`price_histogram`."""
+        where, params = self.where(selection)
+        x_low, x_high, y_low, y_high = self.query(
+            f'SELECT MIN({_quote(x)}), MAX({_quote(x)}), MIN(price), MAX(price) FROM {TABLE} '
+            f'WHERE {where} AND {_quote(x)} IS NOT NULL AND price IS NOT NULL', params)[0]
+        if x_low is None:
+            return aggregates.histogram2d([], [], bins)
+        x_edges = aggregates.range_edges(x_low, x_high, bins[0])
+        y_edges = aggregates.range_edges(y_low, y_high, bins[1])
+        return self._bin_counts(where, params, [x, 'price'], [x_edges, y_edges]), x_edges, y_edges
+
+    def box_summaries(self, selection):
+        """Sorted ``[(make, summary)]`` from per-make counts of each distinct price (GROUP BY in SQL)."""
+        where, params = self.where(selection)
+        rows = self.query(f'SELECT make, price, COUNT(*) FROM {TABLE} WHERE {where} '
+                          'AND make IS NOT NULL AND price IS NOT NULL GROUP BY make, price ORDER BY make, price', params)
+        if not rows:
+            return []
+        counts = pd.DataFrame(rows, columns=['make', 'price', 'n'])
+        return [
+            (make, aggregates.weighted_box_summary(group['price'].to_numpy(), group['n'].to_numpy()))
+            for make, group in counts.groupby('make', sort=True)
+        ]
+
+    def corr(self, selection):
+        """Correlation matrix from pairwise-complete sums computed in one SQL aggregate query."""
+        columns = self.meta['numeric_columns']
+        shift = self.meta['column_means']
+        k = len(columns)
+        terms = []
+        for i in range(k):
+            for j in range(k):
+                both = f'{_quote(columns[i])} IS NOT NULL AND {_quote(columns[j])} IS NOT NULL'
+                x = f'({_quote(columns[i])} - {shift[i]!r})'
+                y = f'({_quote(columns[j])} - {shift[j]!r})'
+                terms += [f'SUM(CASE WHEN {both} THEN 1 ELSE 0 END)',
+                          f'TOTAL(CASE WHEN {both} THEN {x} END)',
+                          f'TOTAL(CASE WHEN {both} THEN {x} * {x} END)',
+                          f'TOTAL(CASE WHEN {both} THEN {x} * {y} END)']
+        where, params = self.where(selection)
+        sums = np.array(self.query(f"SELECT {', '.join(terms)} FROM {TABLE} WHERE {where}", params)[0], dtype='float64')
+        n, sum_x, sum_xx, sum_xy = np.nan_to_num(sums).reshape(k, k, 4).transpose(2, 0, 1)
+        return pd.DataFrame(aggregates.corr_from_sums(n, sum_x, sum_xx, sum_xy), index=columns, columns=columns)
+
+
+def _is_fresh(meta, path):
+    """True when the database was built by this SNAPSHOT_VERSION from the current ``path`` (or the CSV is gone)."""
+    if meta['source'].get('version') != SNAPSHOT_VERSION:
+        return False
+    if not os.path.exists(path):
+        return True
+    return [meta['source']['mtime_ns'], meta['source']['size']] == list(file_fingerprint(path))
+
+
+def open_database(db_path=DB_PATH, path=DATA_PATH):
+    """Return the database backend and a dict describing how it was obtained.
+
+    Built from ``path`` on first use and rebuilt when the CSV changes; cached
+    per process by :func:`vehicles_data.cached_frame` like the cleaned frame.
+    """
+    def build():
+        meta = read_meta(db_path)
+        if meta is not None and _is_fresh(meta, path):
+            return VehicleDatabase(db_path, meta), 'sqlite', None
+        return VehicleDatabase(db_path, build_database(path, db_path)), 'csv', None
+
+    fingerprint = tuple(file_fingerprint(file) if os.path.exists(file) else None for file in (db_path, path))
+    return cached_frame((os.path.abspath(db_path), 'sqlite'), fingerprint, build)
+
+
+def main(argv=None):
+    """Build the database offline, optionally checking it against the in-memory backend."""
+    parser = argparse.ArgumentParser(description='Build the embedded SQLite database of the vehicles CSV.')
+    parser.add_argument('--csv', default=DATA_PATH, help='source CSV (default: %(default)s)')
+    parser.add_argument('--out', default=DB_PATH, help='database path (default: %(default)s)')
+    parser.add_argument('--check', action='store_true',
+                        help='compare every query with the in-memory (pandas) backend; exit 1 on a mismatch')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    meta = build_database(args.csv, args.out)
+    print(f"Wrote {args.out}: {meta['rows']} rows in {time.perf_counter() - start:.2f} s")
+    if not args.check:
+        return 0
+
+    from backends import MemoryBackend, parity_report
+    database = VehicleDatabase(args.out, meta)
+    reference = MemoryBackend(load_vehicles(args.csv, compact=True)[0])
+    mismatches = parity_report(reference, database)
+    for mismatch in mismatches:
+        print(f'mismatch: {mismatch}')
+    print('parity: ok' if not mismatches else f'parity: {len(mismatches)} mismatches')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,510 @@
+# Chunked ingestion of large listing exports into an on-disk columnar store
+# partitioned by make and model year, and out-of-core filters and aggregates over it
+#   python vehicles_store.py --csv vehicles_us.csv --out vehicles_store [--chunksize 250000]
+import argparse
+import json
+import os
+import shutil
+import time
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import aggregates
+from compare import COMPARE_ATTRIBUTES, listing_table
+from features import car_display_name
+from filters import models_offered, selection_key
+from table_view import page_count
+from vehicles_data import (COMPACT_CATEGORY_COLUMNS, DATA_PATH, cached_frame, clean_vehicles, file_fingerprint,
+                           split_model)
+
+
+STORE_PATH = 'vehicles_store'
+MANIFEST_NAME = 'manifest.json'
+
+# Rows per CSV chunk; peak memory of ingestion and of every query scales with this, not the file
+CHUNK_ROWS = 250_000
+
+# Model years per partition bucket: make=<make>/year=<first year of the bucket>
+YEAR_BUCKET = 10
+
+# Original position of each listing in the CSV, kept so partitioned reads restore file order
+ROW_ID = 'row_id'
+
+# Columns every selection is filtered on
+SELECTION_COLUMNS = ['make', 'model', 'model_year']
+
+def _scan_csv(csv_path, chunksize):
+    """First pass over the CSV: model year range, category lists and models per make."""
+    text_columns = ['model'] + [column for column in COMPACT_CATEGORY_COLUMNS if column not in ('make', 'model')]
+    oldest = newest = None
+    seen = {column: set() for column in text_columns}
+    for chunk in pd.read_csv(csv_path, usecols=text_columns + ['model_year'], chunksize=chunksize):
+        if chunk['model_year'].notna().any():
+            low, high = chunk['model_year'].min(), chunk['model_year'].max()
+            oldest = low if oldest is None else min(oldest, low)
+            newest = high if newest is None else max(newest, high)
+        for column in text_columns:
+            seen[column].update(chunk[column].dropna().unique())
+
+    names = split_model(pd.Series(sorted(seen.pop('model')), dtype=object))
+    categories = {column: sorted(values) for column, values in seen.items()}
+    categories['make'] = sorted(names[0].dropna().unique())
+    categories['model'] = sorted(names[1].dropna().unique())
+    models_by_make = {make: sorted(set(models)) for make, models in names.dropna().groupby(0)[1]}
+    years = None if newest is None else (int(oldest), int(newest))
+    return years, categories, models_by_make
+
+
+def clean_chunk(chunk, reference_year, categories):
+    """Clean one CSV chunk to the store schema (the compact dashboard dtypes, fixed categories)."""
+    df_chunk = clean_vehicles(chunk, reference_year, categories)
+    df_chunk['transmission'] = df_chunk['transmission'].astype(pd.CategoricalDtype(categories['transmission']))
+    df_chunk['high_mileage'] = df_chunk['high_mileage'].astype(bool)
+    return df_chunk
+
+
+def partition_path(make, bucket):
+    """Relative path of the partition file of ``make`` and a model-year bucket (None = missing)."""
+    make_part = '__missing__' if make is None else quote(str(make), safe='')
+    year_part = '__missing__' if bucket is None else str(bucket)
+    return f'make={make_part}/year={year_part}/data.parquet'
+
+
+class _PartitionWriter:
+    """One partition's Parquet file and its manifest entry.
+
+    Rows are buffered and written as one row group per :meth:`flush`, so small
+    partitions still get row groups of a useful size.
+    """
+
+    def __init__(self, root, make, bucket, schema, numeric_columns):
+        self.entry = {
+            'path': partition_path(make, bucket),
+            'make': make,
+            'bucket': bucket,
+            'rows': 0,
+            'row_groups': 0,
+            'years': None,
+            'models': set(),
+            'min': {},
+            'max': {},
+        }
+        self.numeric_columns = numeric_columns
+        self.buffer = []
+        self.buffered_rows = 0
+        os.makedirs(os.path.dirname(os.path.join(root, self.entry['path'])), exist_ok=True)
+        self.writer = pq.ParquetWriter(os.path.join(root, self.entry['path']), schema)
+
+    def add(self, df_partition):
+        self.buffer.append(df_partition)
+        self.buffered_rows += len(df_partition)
+        entry = self.entry
+        entry['rows'] += len(df_partition)
+        entry['models'].update(None if pd.isna(model) else model for model in df_partition['model'].unique())
+        for column in self.numeric_columns:
+            values = df_partition[column].dropna()
+            if values.empty:
+                continue
+            low, high = float(values.min()), float(values.max())
+            entry['min'][column] = min(low, entry['min'].get(column, low))
+            entry['max'][column] = max(high, entry['max'].get(column, high))
+        if 'model_year' in entry['min']:
+            entry['years'] = [int(entry['min']['model_year']), int(entry['max']['model_year'])]
+
+    def flush(self):
+        if not self.buffer:
+            return
+        table = pa.Table.from_pandas(pd.concat(self.buffer), schema=self.writer.schema, preserve_index=False)
+        self.writer.write_table(table, row_group_size=len(table))
+        self.entry['row_groups'] += 1
+        self.buffer = []
+        self.buffered_rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        self.entry['models'] = sorted(self.entry['models'], key=lambda model: (model is None, model or ''))
+        return self.entry
+
+
+def _partition_rows(df_chunk):
+    """Row positions of a cleaned chunk per (make, model-year bucket), missing values as None."""
+    make_codes = df_chunk['make'].cat.codes.to_numpy(dtype='int64')
+    years = df_chunk['model_year'].to_numpy(dtype='float64', na_value=np.nan)
+    buckets = np.where(np.isnan(years), -1, np.floor(np.nan_to_num(years) / YEAR_BUCKET) * YEAR_BUCKET).astype('int64')
+    groups = pd.DataFrame({'make': make_codes, 'bucket': buckets}).groupby(['make', 'bucket']).indices
+    makes = df_chunk['make'].cat.categories
+    return {
+        (None if code < 0 else makes[code], None if bucket < 0 else int(bucket)): rows
+        for (code, bucket), rows in groups.items()
+    }
+
+
+def _replace_dir(tmp_path, path):
+    """Swap a finished store directory in place of ``path``."""
+    old_path = None
+    if os.path.exists(path):
+        old_path = f'{path}.old-{os.getpid()}'
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    if old_path is not None:
+        shutil.rmtree(old_path)
+
+
+def ingest_csv(csv_path=DATA_PATH, store_path=STORE_PATH, chunksize=CHUNK_ROWS):
+    """Stream ``csv_path`` into a partitioned Parquet store, ``chunksize`` rows at a time.
+
+    A first pass reads only the model and text columns to fix the reference
+    year of ``car_age`` and the category lists, so every chunk is cleaned
+    exactly as :func:`clean_vehicles` cleans the whole file. The second pass
+    cleans each chunk and appends its rows to one file per make and
+    ``YEAR_BUCKET`` of model years. Neither pass holds more than about two
+    chunks in memory (the chunk being cleaned and the rows buffered for the
+    partition files). Returns the manifest, which records each
+    partition's row count, models and per-column min/max.
+    """
+    start = time.perf_counter()
+    years, categories, models_by_make = _scan_csv(csv_path, chunksize)
+    reference_year = None if years is None else years[1]
+
+    tmp_path = f'{store_path}.tmp-{os.getpid()}'
+    os.makedirs(tmp_path)
+    writers = {}
+    columns = numeric_columns = schema = None
+    sums = counts = None
+    n_rows = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize, low_memory=False):
+        df_chunk = clean_chunk(chunk, reference_year, categories)
+        if columns is None:
+            columns = list(df_chunk.columns)
+            numeric_columns = list(df_chunk.select_dtypes(include='number').columns)
+            sums = np.zeros(len(numeric_columns))
+            counts = np.zeros(len(numeric_columns))
+        values = df_chunk[numeric_columns].to_numpy(dtype='float64', na_value=np.nan)
+        sums += np.nansum(values, axis=0)
+        counts += (~np.isnan(values)).sum(axis=0)
+
+        df_chunk[ROW_ID] = np.arange(n_rows, n_rows + len(df_chunk))
+        n_rows += len(df_chunk)
+        if schema is None:
+            schema = pa.Schema.from_pandas(df_chunk, preserve_index=False)
+        for (make, bucket), rows in _partition_rows(df_chunk).items():
+            if (make, bucket) not in writers:
+                writers[(make, bucket)] = _PartitionWriter(tmp_path, make, bucket, schema, numeric_columns)
+            writers[(make, bucket)].add(df_chunk.iloc[rows])
+        # Keep at most about one chunk buffered, writing the largest partitions first
+        while sum(writer.buffered_rows for writer in writers.values()) > chunksize:
+            max(writers.values(), key=lambda writer: writer.buffered_rows).flush()
+    partitions = [writer.close() for _, writer in sorted(
+        writers.items(), key=lambda item: tuple((value is None, value or 0) for value in item[0]))]
+
+    mtime_ns, size = file_fingerprint(csv_path)
+    manifest = {
+        'source': {'path': os.path.abspath(csv_path), 'mtime_ns': mtime_ns, 'size': size},
+        'created': time.time(),
+        'rows': n_rows,
+        'year_bucket': YEAR_BUCKET,
+        'reference_year': reference_year,
+        'years': years,
+        'columns': columns or [],
+        'numeric_columns': numeric_columns or [],
+        'column_means': [] if sums is None else list(np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)),
+        'categories': categories,
+        'models_by_make': models_by_make,
+        'partitions': partitions,
+        'build_seconds': time.perf_counter() - start,
+    }
+    with open(os.path.join(tmp_path, MANIFEST_NAME), 'w') as handle:
+        json.dump(manifest, handle, indent=1, default=float)
+    _replace_dir(tmp_path, store_path)
+    return manifest
+
+
+class VehicleStore:
+    """Make/model/year selections over a store, answered one row group at a time.
+
+    Offers the same selection API as :class:`backends.MemoryBackend`. The
+    manifest prunes partitions that cannot hold selected rows, partitions
+    lying wholly inside the selection are read without filtering (and counted
+    from the manifest), only the columns a query needs are read, and at most
+    one row group (one ingestion chunk of one partition) is held in memory,
+    plus the query's running result.
+    """
+
+    kind = 'store'
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        self.token = (os.path.abspath(path), manifest['created'])
+        self.n_rows = manifest['rows']
+        self.nbytes = None
+        self.columns = manifest['columns']
+        self.makes = manifest['categories']['make']
+        self.models_by_make = manifest['models_by_make']
+        self.min_year, self.max_year = manifest['years'] or (None, None)
+        self.partitions = manifest['partitions']
+        self.dtypes = {column: pd.CategoricalDtype(values) for column, values in manifest['categories'].items()}
+
+    def models_for(self, makes):
+        """Sorted models offered by any of ``makes``."""
+        return models_offered(self.models_by_make, makes)
+
+    def key(self, makes=(), models=(), year_range=None):
+        """Canonical, hashable form of a selection, as :meth:`filters.FilterIndex.key`."""
+        return selection_key(self.token, makes, models, year_range, self.min_year, self.max_year)
+
+    def partitions_for(self, selection):
+        """``[(partition, whole)]`` of the partitions that can hold rows of the selection.
+
+        ``whole`` marks partitions lying entirely inside it, which need no row filtering.
+        """
+        _, makes, models, year_range = selection
+        chosen = []
+        for partition in self.partitions:
+            if makes and partition['make'] not in makes:
+                continue
+            if models and not set(models) & set(partition['models']):
+                continue
+            years = partition['years']
+            if year_range is not None and (years is None or years[1] < year_range[0] or years[0] > year_range[1]):
+                continue
+            whole = (not models or set(partition['models']) <= set(models)) and (
+                year_range is None or year_range[0] <= years[0] and years[1] <= year_range[1])
+            chosen.append((partition, whole))
+        return chosen
+
+    def _read(self, handle, row_group, columns):
+        """``columns`` of one row group, with the store's categories and CSV row positions as index."""
+        df_part = handle.read_row_group(row_group, columns=list(columns) + [ROW_ID]).to_pandas()
+        for column in df_part.columns.intersection(list(self.dtypes)):
+            df_part[column] = df_part[column].astype(self.dtypes[column])
+        df_part.index = pd.Index(df_part.pop(ROW_ID).to_numpy(), name=None)
+        return df_part
+
+    def scan(self, selection, columns, partitions=None):
+        """Yield the selected rows of ``columns``, row group by row group.
+
+        Rows come in file order within a partition, but partitions are read
+        one after another; the index holds each row's position in the CSV.
+        """
+        for _, _, df_part in self._scan_groups(selection, columns, partitions):
+            yield df_part
+
+    def _scan_groups(self, selection, columns, partitions=None):
+        """:meth:`scan`, also yielding the partition and row group each frame was read from."""
+        _, makes, models, year_range = selection
+        for partition, whole in self.partitions_for(selection) if partitions is None else partitions:
+            filter_columns = [] if whole else [
+                column for column, active in zip(SELECTION_COLUMNS, (makes, models, year_range)) if active]
+            read_columns = list(dict.fromkeys(list(columns) + filter_columns))
+            handle = pq.ParquetFile(os.path.join(self.path, partition['path']))
+            for row_group in range(partition['row_groups']):
+                df_part = self._read(handle, row_group, read_columns)
+                if whole:
+                    yield partition, row_group, df_part
+                    continue
+                mask = np.ones(len(df_part), dtype=bool)
+                if models:
+                    mask &= df_part['model'].isin(models).to_numpy()
+                if year_range is not None:
+                    years = df_part['model_year'].to_numpy(dtype='float64', na_value=np.nan)
+                    mask &= (years >= year_range[0]) & (years <= year_range[1])
+                yield partition, row_group, df_part.loc[mask, list(columns)]
+
+    def _values(self, selection, columns, condition=None, partitions=None):
+        """Selected ``columns`` as float arrays (NaN for missing), row group by row group."""
+        for df_part in self.scan(selection, list(columns) + (['condition'] if condition is not None else []),
+                                 partitions):
+            if condition is not None:
+                df_part = df_part[df_part['condition'] == condition]
+            yield [df_part[column].to_numpy(dtype='float64', na_value=np.nan) for column in columns]
+
+    def count(self, selection):
+        """Number of listings in the selection; whole partitions are counted from the manifest."""
+        partitions = self.partitions_for(selection)
+        partial = [(partition, whole) for partition, whole in partitions if not whole]
+        return sum(partition['rows'] for partition, whole in partitions if whole) + sum(
+            len(df_part) for df_part in self.scan(selection, [], partial))
+
+    def frame(self, selection, columns=None):
+        """The selected rows as one frame in file order; only for selections known to be small."""
+        columns = columns or self.columns
+        parts = list(self.scan(selection, columns))
+        return pd.concat(parts).sort_index() if parts else pd.DataFrame(columns=columns)
+
+    def page(self, selection, sort_by=None, ascending=True, page_number=1, page_size=25, columns=None):
+        """One page of the selection in display order, plus the total row and page counts.
+
+        The first pass reads only the sort column, keeping the first
+        ``page_number * page_size`` rows seen so far (in sort order, then file
+        order) and where they were read from; the second reads the page's
+        columns from just the row groups holding its rows.
+        """
+        total_rows = self.count(selection)
+        n_pages = page_count(total_rows, page_size)
+        page_number = min(max(1, page_number), n_pages)
+        start, stop = (page_number - 1) * page_size, page_number * page_size
+        columns = list(columns or self.columns)
+
+        best, locations = None, {}
+        for partition, row_group, df_part in self._scan_groups(selection, [sort_by] if sort_by else []):
+            location = len(locations)
+            locations[location] = (partition, row_group)
+            df_part = df_part.assign(_location=location)
+            candidates = df_part if best is None else pd.concat([best, df_part])
+            if sort_by is None:
+                best = candidates.sort_index().head(stop)
+            else:
+                # Ties are broken by CSV position, as the stable in-memory sort does
+                candidates = candidates.rename_axis('_position')
+                best = candidates.sort_values([sort_by, '_position'], ascending=[ascending, True],
+                                              na_position='last').head(stop).rename_axis(None)
+        if best is None or len(best) <= start:
+            return pd.DataFrame(columns=columns), total_rows, n_pages
+
+        wanted = best.iloc[start:stop]
+        pieces = []
+        for location, rows in wanted.groupby('_location'):
+            partition, row_group = locations[location]
+            handle = pq.ParquetFile(os.path.join(self.path, partition['path']))
+            pieces.append(self._read(handle, row_group, columns).loc[rows.index])
+        return pd.concat(pieces).loc[wanted.index], total_rows, n_pages
+
+    def car_names(self, selection):
+        """Sorted 'make model' names with a listing in the selection."""
+        names = set()
+        for df_part in self.scan(selection, ['make', 'model']):
+            names.update(car_display_name(df_part['make'], df_part['model']).unique())
+        return sorted(names)
+
+    def comparison(self, selection, names, attributes=COMPARE_ATTRIBUTES):
+        """Attribute-by-car table of the first listing of each name in the selection."""
+        first = {}
+        for df_part in self.scan(selection, attributes):
+            part_names = car_display_name(df_part['make'], df_part['model'])
+            for name in set(names):
+                matches = np.flatnonzero((part_names == name).to_numpy())
+                if matches.size and (name not in first or df_part.index[matches[0]] < first[name].name):
+                    first[name] = df_part.iloc[matches[0]]
+        return listing_table(pd.DataFrame([first[name] for name in names]), names, attributes)
+
+    def conditions(self, selection):
+        """Conditions present in the selection, in order of first appearance."""
+        first_rows = {}
+        for df_part in self.scan(selection, ['condition']):
+            known = df_part['condition'].dropna()
+            for condition, row in known.index.to_series().groupby(known.to_numpy()).min().items():
+                first_rows[condition] = min(row, first_rows.get(condition, row))
+        return sorted(first_rows, key=first_rows.get)
+
+    def price_histogram(self, selection, condition=None):
+        """Price counts and bin edges of the selection, in two passes (extremes, then counts).
+
+        The extremes of whole partitions come from the manifest's min/max stats.
+        """
+        low = high = None
+        partitions = self.partitions_for(selection)
+        for partition, whole in partitions:
+            if whole and condition is None and 'price' in partition['min']:
+                low = min(low, partition['min']['price']) if low is not None else partition['min']['price']
+                high = max(high, partition['max']['price']) if high is not None else partition['max']['price']
+        partial = [(partition, whole) for partition, whole in partitions
+                   if not (whole and condition is None and 'price' in partition['min'])]
+        for (prices,) in self._values(selection, ['price'], condition, partial):
+            prices = prices[~np.isnan(prices)]
+            if prices.size:
+                low = prices.min() if low is None else min(low, prices.min())
+                high = prices.max() if high is None else max(high, prices.max())
+        edges = aggregates.range_edges(low, high)
+        counts = np.zeros(len(edges) - 1, dtype='int64')
+        if low is not None:
+            for (prices,) in self._values(selection, ['price'], condition):
+                counts += aggregates.histogram(prices, edges)
+        return counts, edges
+
+    def price_density(self, selection, x, bins=(60, 60)):
+        """2D counts of ``x`` against price, in two passes like :meth:`price_histogram`."""
+        extremes = None
+        for x_values, prices in self._values(selection, [x, 'price']):
+            known = ~(np.isnan(x_values) | np.isnan(prices))
+            if known.any():
+                part = np.array([[x_values[known].min(), prices[known].min()],
+                                 [x_values[known].max(), prices[known].max()]])
+                extremes = part if extremes is None else np.array([np.minimum(extremes[0], part[0]),
+                                                                   np.maximum(extremes[1], part[1])])
+        if extremes is None:
+            return aggregates.histogram2d([], [], bins)
+        x_edges = aggregates.range_edges(extremes[0, 0], extremes[1, 0], bins[0])
+        y_edges = aggregates.range_edges(extremes[0, 1], extremes[1, 1], bins[1])
+        counts = np.zeros(bins, dtype='int64')
+        for x_values, prices in self._values(selection, [x, 'price']):
+            known = ~(np.isnan(x_values) | np.isnan(prices))
+            counts += np.histogram2d(x_values[known], prices[known], bins=[x_edges, y_edges])[0].astype('int64')
+        return counts, x_edges, y_edges
+
+    def box_summaries(self, selection):
+        """Sorted ``[(make, summary)]`` of prices, from per-make counts of each distinct price."""
+        pending, pending_rows = [], 0
+        for df_part in self.scan(selection, ['make', 'price']):
+            pending.append(df_part.dropna().groupby(['make', 'price'], observed=True).size())
+            pending_rows += len(pending[-1])
+            if pending_rows > 4 * len(pending[0]) + CHUNK_ROWS:
+                # Merge the buffered counts; memory stays bounded by the distinct (make, price) pairs
+                pending = [pd.concat(pending).groupby(level=['make', 'price'], observed=True).sum()]
+                pending_rows = len(pending[0])
+        if not pending:
+            return []
+        price_counts = pd.concat(pending).groupby(level=['make', 'price'], observed=True).sum()
+        if price_counts.empty:
+            return []
+        return [
+            (make, aggregates.weighted_box_summary(counts.index.get_level_values('price'), counts.to_numpy()))
+            for make, counts in price_counts.sort_index().groupby(level='make', observed=True)
+        ]
+
+    def corr(self, selection):
+        """Correlation matrix of the numeric columns, summed part by part from pairwise sums."""
+        columns = self.manifest['numeric_columns']
+        shift = np.array(self.manifest['column_means'])
+        totals = [np.zeros((len(columns), len(columns))) for _ in range(4)]
+        for values in self._values(selection, columns):
+            for total, part in zip(totals, aggregates.pairwise_sums(np.column_stack(values), shift)):
+                total += part
+        return pd.DataFrame(aggregates.corr_from_sums(*totals), index=columns, columns=columns)
+
+
+def open_store(path=STORE_PATH):
+    """Return the store at ``path`` and a dict describing how it was obtained.
+
+    Cached per process by :func:`vehicles_data.cached_frame` like the cleaned
+    frame; a rebuilt store (new manifest) is picked up on the next call.
+    """
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+
+    def build():
+        with open(manifest_path) as handle:
+            return VehicleStore(path, json.load(handle)), 'store', None
+
+    return cached_frame((os.path.abspath(path), 'store'), file_fingerprint(manifest_path), build)
+
+
+def main(argv=None):
+    """Ingest a listings CSV into the store, e.g. as a deploy build step."""
+    parser = argparse.ArgumentParser(description='Stream a vehicles CSV into the partitioned Parquet store.')
+    parser.add_argument('--csv', default=DATA_PATH, help='source CSV (default: %(default)s)')
+    parser.add_argument('--out', default=STORE_PATH, help='store directory (default: %(default)s)')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS, help='rows per chunk (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    manifest = ingest_csv(args.csv, args.out, args.chunksize)
+    print(f"Wrote {args.out}: {manifest['rows']} rows in {len(manifest['partitions'])} partitions "
+          f"in {manifest['build_seconds']:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+# Background warm-up of the popular sidebar selections, ranked by the usage the app records
+#   WARMUP=0 disables it; WARMUP_TOP_MAKES, WARMUP_TOP_PAIRS, WARMUP_INTERVAL (s), WARMUP_WORKERS
+#   VEHICLES_USAGE=<json file> keeps the counts across restarts
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from result_cache import results
+
+
+ENABLED = os.environ.get('WARMUP', '1') != '0'
+TOP_MAKES = int(os.environ.get('WARMUP_TOP_MAKES', '5'))
+TOP_PAIRS = int(os.environ.get('WARMUP_TOP_PAIRS', '10'))
+INTERVAL = float(os.environ.get('WARMUP_INTERVAL', '300'))
+WORKERS = int(os.environ.get('WARMUP_WORKERS', '2'))
+USAGE_PATH = os.environ.get('VEHICLES_USAGE', 'usage_counts.json')
+
+
+class UsageCounts:
+    """How often each make and each (make, model) pair was selected, shared by every session.
+
+    Counts are merged into ``path`` by :meth:`save`, so they survive restarts
+    and several worker processes add up instead of overwriting each other.
+    """
+
+    def __init__(self, path=USAGE_PATH):
+        self.path = path
+        self.makes = Counter()
+        self.pairs = Counter()
+        self._unsaved = (Counter(), Counter())
+        self._lock = threading.Lock()
+        self._merge_file()
+
+    def record(self, makes, pairs):
+        with self._lock:
+            for counts, unsaved, items in ((self.makes, self._unsaved[0], makes),
+                                           (self.pairs, self._unsaved[1], pairs)):
+                counts.update(items)
+                unsaved.update(items)
+
+    def top_makes(self, n):
+        with self._lock:
+            return [make for make, _ in self.makes.most_common(n)]
+
+    def top_pairs(self, n):
+        with self._lock:
+            return [pair for pair, _ in self.pairs.most_common(n)]
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return Counter(), Counter()
+        try:
+            with open(self.path) as handle:
+                saved = json.load(handle)
+        except (OSError, ValueError):
+            return Counter(), Counter()
+        return Counter(saved.get('makes', {})), Counter({(make, model): n for make, model, n in saved.get('pairs', [])})
+
+    def _merge_file(self):
+        makes, pairs = self._read()
+        with self._lock:
+            self.makes.update(makes)
+            self.pairs.update(pairs)
+
+    def save(self):
+        """Add the counts recorded since the last save to the file (no-op when nothing is new)."""
+        if not self.path:
+            return
+        with self._lock:
+            new_makes, new_pairs = self._unsaved
+            if not new_makes and not new_pairs:
+                return
+            self._unsaved = (Counter(), Counter())
+        makes, pairs = self._read()
+        makes.update(new_makes)
+        pairs.update(new_pairs)
+        tmp_path = f'{self.path}.tmp-{os.getpid()}'
+        try:
+            with open(tmp_path, 'w') as handle:
+                json.dump({'makes': dict(makes), 'pairs': [[make, model, n] for (make, model), n in pairs.items()]},
+                          handle)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # Read-only filesystems keep the counts in memory only
+            pass
+
+
+# Shared by every session in the process
+usage = UsageCounts()
+
+
+def record_selection(backend, makes, models):
+    """Count one sidebar selection: each chosen make, and each chosen model paired with its make."""
+    usage.record(list(makes), [(make, model) for make in makes for model in models
+                               if model in backend.models_for([make])])
+
+
+def warm_selection(backend, selection, point_limit):
+    """Compute the aggregates my_app.py reads for ``selection``, under the same result cache keys."""
+    n_rows = results.get_or_compute((selection, 'count'), lambda: backend.count(selection))
+    results.get_or_compute((selection, 'price_hist'), lambda: backend.price_histogram(selection))
+    conditions = results.get_or_compute((selection, 'conditions'), lambda: backend.conditions(selection))
+    if conditions:
+        # The condition panel opens on the first condition
+        results.get_or_compute((selection, 'price_hist', conditions[0]),
+                               lambda: backend.price_histogram(selection, conditions[0]))
+    results.get_or_compute((selection, 'box'), lambda: backend.box_summaries(selection))
+    results.get_or_compute((selection, 'corr'), lambda: backend.corr(selection))
+    if n_rows > point_limit:
+        for x in ('car_age', 'odometer_miles'):
+            results.get_or_compute((selection, 'density', x), lambda x=x: backend.price_density(selection, x))
+
+
+class WarmupScheduler:
+    """Daemon thread warming the top makes and make/model pairs, at start and every ``interval`` s.
+
+    Until enough usage is recorded, the makes with the most listings fill the top makes.
+    Selections are computed by a pool of ``workers`` threads; results go to
+    the shared result cache, so the first user to pick one gets cache hits.
+    """
+
+    def __init__(self, backend, point_limit, top_makes=TOP_MAKES, top_pairs=TOP_PAIRS, interval=INTERVAL,
+                 workers=WORKERS, usage_counts=usage):
+        self.backend = backend
+        self.point_limit = point_limit
+        self.top_makes = top_makes
+        self.top_pairs = top_pairs
+        self.interval = interval
+        self.workers = workers
+        self.usage = usage_counts
+        self.rounds = 0
+        self.last_round = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def selections(self):
+        """Canonical selections to warm, most popular first."""
+        makes = self.usage.top_makes(self.top_makes)
+        if len(makes) < self.top_makes:
+            listings = {make: self.backend.count(self.backend.key([make])) for make in self.backend.makes}
+            makes += [make for make in sorted(listings, key=listings.get, reverse=True)
+                      if make not in makes][:self.top_makes - len(makes)]
+        selections = [self.backend.key([make]) for make in makes]
+        selections += [self.backend.key([make], [model]) for make, model in self.usage.top_pairs(self.top_pairs)]
+        return selections
+
+    def run_round(self):
+        """Warm every selection once; returns a summary of the round."""
+        start = time.perf_counter()
+        selections = self.selections()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='warmup') as pool:
+            list(pool.map(lambda selection: warm_selection(self.backend, selection, self.point_limit), selections))
+        self.usage.save()
+        self.rounds += 1
+        self.last_round = {'selections': len(selections), 'seconds': time.perf_counter() - start,
+                           'finished': time.time()}
+        return self.last_round
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_round()
+                self.last_error = None
+            except Exception as error:  # a failed round must not stop later rounds
+                self.last_error = repr(error)
+            self._stop.wait(self.interval)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def start(backend, point_limit):
+    """Start the warm-up of ``backend`` once per process; returns its scheduler (None when disabled).
+
+    A backend replaced by a newer one (e.g. after the CSV changed) has its scheduler stopped.
+    """
+    if not ENABLED:
+        return None
+    with _schedulers_lock:
+        scheduler = _schedulers.get(backend.token)
+        if scheduler is None:
+            for token in list(_schedulers):
+                _schedulers.pop(token).stop()
+            scheduler = _schedulers[backend.token] = WarmupScheduler(backend, point_limit).start()
+        return scheduler